@@ -1,33 +1,10 @@
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import time
-import urllib.parse
-
-def setup_webdriver():
-    """
-    Set up Chrome WebDriver with options for more reliable scraping.
-    
-    Returns:
-        webdriver.Chrome: Configured Chrome WebDriver
-    """
-    # Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    # Uncomment the next line to run in headless mode
-    # chrome_options.add_argument("--headless")
-    
-    # Setup the WebDriver
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    
-    return driver
+import functools
+from browser import setup_webdriver, wait_for_search_page
+from rate_limit import get_limiter
+from sku_source import RowSource
+from paddy_search import build_search_url, SearchOutcome, unknown, status_flag, FOUND, NOT_FOUND
+from retry import with_retries
 
 def search_paddy_pallin(driver, search_string):
     """
@@ -38,85 +15,84 @@ def search_paddy_pallin(driver, search_string):
         search_string (str): SKU or product to search
     
     Returns:
-        bool: True if no products found, False otherwise
+        SearchOutcome: NOT_FOUND if the no results message showed up, FOUND if
+            it didn't, UNKNOWN with the reason if the page couldn't be loaded
     """
-    # Encode the search string for URL
-    encoded_search = urllib.parse.quote(search_string)
-    
     # Construct the search URL
-    url = f"https://www.paddypallin.com.au/nsearch?q={encoded_search}"
+    url = build_search_url(search_string)
     
     try:
-        # Navigate to the URL
-        driver.get(url)
+        # Navigate to the URL, paced by the host's adaptive rate limiter
+        with get_limiter(url).throttled():
+            driver.get(url)
         
-        # Wait for the search results container to load
+        # Wait for the no results message, a listed product or an error page, whichever shows up first
         # Adjust the timeout as needed (currently set to 10 seconds)
-        wait = WebDriverWait(driver, 10)
+        state = wait_for_search_page(
+            driver, lambda state: state.no_results or state.product_items or state.error, timeout=10
+        )
         
-        try:
-            # Try to find the no results container
-            no_results_container = wait.until(
-                EC.presence_of_element_located((By.CLASS_NAME, 'nxt-nrf-container'))
-            )
-            
-            # Check if the text indicates no results
-            if "did not match any products" in no_results_container.text:
-                return True
-            
-        except:
-            # If the no results container is not found, assume products exist
-            return False
+        if state is not None and state.error:
+            return unknown("Browser error page")
+        
+        # Check if the text indicates no results
+        if state is not None and state.no_results:
+            return SearchOutcome(NOT_FOUND)
+        
+        # If the no results message didn't show up, assume products exist
+        return SearchOutcome(FOUND)
         
     except Exception as e:
+        # Page loads that time out or fail, or a crashed browser, are worth another try
         print(f"Error searching for {search_string}: {e}")
-        return False
+        return unknown(str(e))
 
-def process_excel_file(input_file, output_file):
+def process_excel_file(input_file, output_file, fast=False):
     """
     Process the Excel file, search for each SKU, and output results.
     
     Args:
-        input_file (str): Path to input Excel file
+        input_file (str): Path to input file (.xlsx, .csv or .parquet)
         output_file (str): Path to output Excel file
+        fast (bool): Use the lean browser profile (headless, eager page
+            loads, no images, stylesheets, fonts or analytics)
     """
     # Setup WebDriver
-    driver = setup_webdriver()
+    driver = setup_webdriver(fast=fast)
     
     try:
-        # Read the input Excel file
-        df = pd.read_excel(input_file)
+        # Stream rows from the input file as they are read
+        source = RowSource(input_file)
         
         # List to store results
         results = []
         
         # Iterate through each row
-        for index, row in df.iterrows():
+        for index, row in source:
             sku = str(row['Item Code'])
             
             # Check if the SKU returns no results
             try:
-                no_results = search_paddy_pallin(driver, sku)
-                row_data = row.to_dict()  # Convert the row to a dictionary
+                # Retry failed page loads before giving up on the SKU
+                outcome = with_retries(functools.partial(search_paddy_pallin, driver), sku)
+                row_data = dict(row)  # Copy the row
                 results.append({
                     'SKU': sku,
-                    'No Results Found': no_results
+                    'No Results Found': status_flag(outcome, NOT_FOUND),
+                    'Error': outcome.reason
                 })
-                
-                # Add a small delay between searches to reduce load on the server
-                time.sleep(1)
             except Exception as e:
                 print(f"Error processing SKU {sku}: {e}")
                 
                 # Add the error information to the row and append
-                row_data = row.to_dict()
+                row_data = dict(row)
                 row_data['No Results Found'] = None
                 row_data['Error'] = str(e)
                 
                 results.append(row_data) 
 
             # Optional: print progress
-            print(f"Processed {index + 1}/{len(df)} SKUs")
+            print(f"Processed {index + 1}/{source.total or '?'} SKUs")
         
         # Convert results to DataFrame
         results_df = pd.DataFrame(results)
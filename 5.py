@@ -1,34 +1,90 @@
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import time
 import concurrent.futures
-import urllib.parse
+import functools
+import argparse
+import queue
+import threading
+from selenium.common.exceptions import WebDriverException
+from browser import setup_webdriver, wait_for_search_page, archive_page_source
+from rate_limit import get_limiter
+from driver_pool import DriverPool, DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB
+from paddy_search import build_search_url, SearchOutcome, unknown, status_flag, FOUND, NOT_FOUND, UNKNOWN
+from tiered import http_classify
+from http_session import configure_session
+from result_cache import ResultCache, DEFINITIVE_ENGINES
+from checkpoint import Checkpoint, checkpoint_path
+from sku_source import RowSource
+from result_sink import write_results, write_fanned_out
+from retry import with_retries
+from shard import parse_shard, in_shard, shard_path, merge_shards
+from metrics import get_metrics, Progress, finish_run
+from page_archive import configure_archive
+from catalogue_index import CatalogueIndex
+from tab_search import TabSearcher
+from browser_fetch import BrowserFetcher, DEFAULT_BATCH_SIZE
 
-def setup_webdriver():
+# Columns of the output file
+OUTPUT_COLUMNS = ['Item Code', 'No Results Found', 'Product Count', 'Error']
+
+# Most browsers started when the pool is sized from the free memory
+MAX_BROWSERS = 16
+
+def outcome_row(search_string, outcome):
     """
-    Set up Chrome WebDriver with options for more reliable scraping.
+    Build the output row for a checked SKU.
+    
+    Args:
+        search_string (str): SKU or product searched
+        outcome (SearchOutcome): Outcome of the check
     
     Returns:
-        webdriver.Chrome: Configured Chrome WebDriver
+        dict: Search result information, No Results Found is left blank if
+            the SKU couldn't be checked and Error says why
     """
-    # Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    # Uncomment the next line to run in headless mode
-    # chrome_options.add_argument("--headless")
+    return {
+        'Item Code': search_string,
+        'No Results Found': status_flag(outcome, NOT_FOUND),
+        'Product Count': outcome.product_count,
+        'Error': outcome.reason
+    }
+
+def is_search_settled(state):
+    """
+    Check if a search page shows product items, the no results message or an error page.
     
-    # Setup the WebDriver
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    Args:
+        state (PageState): Markers on the page
     
-    return driver
+    Returns:
+        bool: True once the page can be classified
+    """
+    return bool(state.product_items or state.no_results or state.error)
+
+def outcome_from_state(state):
+    """
+    Classify a search page from its markers.
+    
+    Args:
+        state (PageState): Last markers read from the page, None if none could be read
+    
+    Returns:
+        SearchOutcome: FOUND with the number of products listed, NOT_FOUND, or
+            UNKNOWN with the reason if the page couldn't be classified
+    """
+    if state is None or not state.product_list and not state.no_results and not state.error:
+        return unknown("Timed out waiting for the search results")
+    
+    if state.error:
+        return unknown("Browser error page")
+    
+    # If product items exist, it's a valid result
+    if state.product_items:
+        return SearchOutcome(FOUND, product_count=state.product_items)
+    
+    if state.no_results:
+        return SearchOutcome(NOT_FOUND, product_count=0)
+    
+    # If neither condition is met the page may not have finished rendering, try again
+    return unknown("Neither product items nor the no results message found")
 
 def search_paddy_pallin(driver, search_string):
     """
@@ -39,123 +95,377 @@ def search_paddy_pallin(driver, search_string):
         search_string (str): SKU or product to search
     
     Returns:
-        dict: Search result information
+        SearchOutcome: FOUND with the number of products listed, NOT_FOUND, or
+            UNKNOWN with the reason if the page couldn't be classified
     """
-    # Encode the search string for URL
-    encoded_search = urllib.parse.quote(search_string)
-    
     # Construct the search URL
-    url = f"https://www.paddypallin.com.au/nsearch?q={encoded_search}"
+    url = build_search_url(search_string)
     
     try:
-        # Navigate to the URL
-        driver.get(url)
+        # Navigate to the URL, paced by the host's adaptive rate limiter
+        with get_limiter(url).throttled(), get_metrics().timer('navigation'):
+            driver.get(url)
         
-        # Wait for the search results container to load
-        wait = WebDriverWait(driver, 10)
+        # Wait for product items, the no results message or an error page, whichever shows up first
+        with get_metrics().timer('dom_wait'):
+            state = wait_for_search_page(driver, is_search_settled, timeout=10)
         
-        try:
-            # Look for the product list container
-            product_container = wait.until(
-                EC.presence_of_element_located((By.ID, 'amasty-shopby-product-list'))
-            )
-            
-            # Check for product items
-            product_items = product_container.find_elements(By.CLASS_NAME, 'product-item')
-            
-            # If product items exist, it's a valid result
-            if product_items:
-                return {
-                    'Item Code': search_string,
-                    'No Results Found': False,
-                    'Product Count': len(product_items)
-                }
-            
-            # If no product items, check for no results message
-            no_results_container = driver.find_elements(By.CLASS_NAME, 'nxt-nrf-container')
-            
-            if no_results_container and "did not match any products" in no_results_container[0].text:
-                return {
-                    'Item Code': search_string,
-                    'No Results Found': True,
-                    'Product Count': 0
-                }
-            
-            # If neither condition is met, return uncertain result
-            return {
-                'Item Code': search_string,
-                'No Results Found': None,
-                'Product Count': 0
-            }
-        
-        except Exception as e:
-            print(f"Error processing {search_string}: {e}")
-            return {
-                'Item Code': search_string,
-                'No Results Found': None,
-                'Error': str(e)
-            }
+        # Keep the rendered page for re-classifying later, if archiving is on
+        archive_page_source(driver, search_string, url)
+        
+        return outcome_from_state(state)
         
     except Exception as e:
+        # Page loads that time out or fail are worth another try
         print(f"Error searching for {search_string}: {e}")
-        return {
-            'Item Code': search_string,
-            'No Results Found': None,
-            'Error': str(e)
-        }
+        get_metrics().inc('errors_total', error=type(e).__name__)
+        return unknown(str(e))
+
+def search_with_pool(pool, search_string, cache=None):
+    """
+    Check out a driver from the pool and search for a product with it,
+    retrying failed searches with backoff.
+    
+    Args:
+        pool (DriverPool): Pool of WebDrivers
+        search_string (str): SKU or product to search
+        cache (ResultCache): Record definitive answers in this cache
+    
+    Returns:
+        dict: Search result information
+    """
+    def search_once(search_string):
+        # The driver is ours alone until the with block returns it to the pool
+        with pool.driver() as driver:
+            return search_paddy_pallin(driver, search_string)
+    
+    # The driver goes back to the pool between attempts, so backing off doesn't hold it
+    # and a crashed one is replaced before the next try
+    outcome = with_retries(search_once, search_string)
+    
+    # Uncertain results and errors aren't cached so they are retried next run
+    if cache is not None and outcome.status != UNKNOWN:
+        cache.put(search_string, outcome.status, 'selenium', product_count=outcome.product_count)
+    
+    return outcome_row(search_string, outcome)
+
+def search_with_tabs(pool, jobs, tabs, on_result):
+    """
+    Check out a driver from the pool and search for SKUs from a shared queue
+    in its tabs, until the queue is empty.
+    
+    Args:
+        pool (DriverPool): Pool of WebDrivers
+        jobs (queue.Queue): SKUs left to search, shared by every browser
+        tabs (int): Searches run at once in the browser
+        on_result (callable): Called with (sku, SearchOutcome) for each SKU
+    """
+    searched = 0
+    
+    def take(limit):
+        nonlocal searched
+        
+        # Stop at the driver's page limit, so it goes back to the pool to be recycled
+        while limit is None or searched < limit:
+            try:
+                sku = jobs.get_nowait()
+            except queue.Empty:
+                return
+            searched += 1
+            yield sku
+    
+    while not jobs.empty():
+        searched = 0
+        try:
+            # Pages are counted as the tabs take SKUs
+            with pool.driver(pages=0) as driver:
+                try:
+                    TabSearcher(driver, tabs=tabs).search_all(take(pool.pages_left(driver)), is_search_settled, outcome_from_state, on_result)
+                finally:
+                    pool.add_pages(driver, searched)
+        except WebDriverException as e:
+            # The SKUs the browser held were reported as UNKNOWN, the pool replaces it for the rest
+            print(f"Error in browser tabs, starting a new browser: {e}")
+
+def search_with_browser_fetch(pool, jobs, on_result, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Check out a driver from the pool and search for batches of SKUs from a
+    shared queue with fetch() calls inside its page, until the queue is empty.
+    
+    Args:
+        pool (DriverPool): Pool of WebDrivers
+        jobs (queue.Queue): SKUs left to search, shared by every browser
+        on_result (callable): Called with (sku, SearchOutcome) for each SKU
+        batch_size (int): SKUs fetched at once
+    """
+    while True:
+        batch = []
+        while len(batch) < batch_size:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        
+        if not batch:
+            return
+        
+        try:
+            # The driver keeps its session between batches, so the site is only loaded once
+            with pool.driver(pages=len(batch)) as driver:
+                outcomes = BrowserFetcher(driver, batch_size=batch_size).search_all(batch)
+        except WebDriverException as e:
+            print(f"Error fetching searches in the browser: {e}")
+            outcomes = [unknown(str(e))] * len(batch)
+        
+        for sku, outcome in zip(batch, outcomes):
+            on_result(sku, outcome)
+
+def http_search(search_string, cache=None):
+    """
+    Search for a product with a plain HTTP request instead of a browser.
+    
+    Args:
+        search_string (str): SKU or product to search
+        cache (ResultCache): Record definitive answers in this cache
+    
+    Returns:
+        dict: Search result information, or None if the page was inconclusive
+            or the request kept failing
+    """
+    # Retry failed requests before handing the SKU to a browser
+    outcome = with_retries(http_classify, search_string)
+    
+    if outcome.status == UNKNOWN:
+        return None
+    
+    if cache is not None:
+        cache.put(search_string, outcome.status, 'http', product_count=outcome.product_count)
+    
+    return outcome_row(search_string, outcome)
 
-def process_excel_file(input_file, output_file, max_workers=5):
+def cached_search(cache, search_string):
+    """
+    Build a search result from the cache.
+    
+    Args:
+        cache (ResultCache): Result cache
+        search_string (str): SKU or product to search
+    
+    Returns:
+        dict: Search result information, or None if the SKU isn't cached
+    """
+    cached = cache.lookup(search_string)
+    
+    if cached is None:
+        return None
+    
+    return outcome_row(search_string, SearchOutcome(cached.status, product_count=cached.product_count or 0))
+
+def process_excel_file(input_file, output_file, max_workers=None, hybrid=False, http_workers=20, fast=False, cache=None, resume=False, shard=None, index=None, tabs=None, browser_fetch=False,
+                       max_pages=DEFAULT_MAX_PAGES, max_rss_mb=DEFAULT_MAX_RSS_MB):
     """
     Process the Excel file using concurrent searches.
     
     Args:
-        input_file (str): Path to input Excel file
-        output_file (str): Path to output Excel file
-        max_workers (int): Number of concurrent searches
+        input_file (str): Path to input file (.xlsx, .csv or .parquet)
+        output_file (str): Path to output file (.xlsx, .csv or .parquet)
+        max_workers (int): Number of concurrent browsers, None to start as
+            many as fit in the free memory (up to MAX_BROWSERS)
+        hybrid (bool): Try a plain HTTP check first and only use browsers
+            for SKUs it can't classify
+        http_workers (int): Number of concurrent HTTP checks in hybrid mode
+        fast (bool): Use the lean browser profile (headless, eager page
+            loads, no images, stylesheets, fonts or analytics)
+        cache (ResultCache): Serve recently checked SKUs from this cache
+        resume (bool): Skip SKUs already in the checkpoint of an earlier run
+        shard (tuple): (shard number, number of shards) to only check that
+            shard's SKUs and write them to a partial result file
+        index (CatalogueIndex): SKUs known to be listed, only the rest are
+            searched (their Product Count is left blank)
+        tabs (int): Run this many searches at once in each browser, in its
+            tabs, instead of one search per browser
+        browser_fetch (bool): Search in batches of fetch() calls inside
+            each browser's page first, and only load the search page for
+            SKUs that can't be classified that way
+        max_pages (int): Pages a browser loads before it is replaced with a
+            fresh one, None for no limit
+        max_rss_mb (float): Memory in MB a browser may use before it is
+            replaced with a fresh one, None for no limit
     """
-    # Read the input Excel file
-    df = pd.read_excel(input_file)
+    if shard is not None:
+        # Each shard has its own partial result file and checkpoint
+        output_file = shard_path(output_file, shard)
+    
+    # Results are written to the checkpoint as they finish
+    checkpoint = Checkpoint(checkpoint_path(output_file), resume=resume)
+    
+    # Only the SKU column is kept, streamed from the input file
+    source = RowSource(input_file)
+    
+    # Each distinct SKU is checked once, skipping those finished by the run being resumed
+    # and those belonging to other shards
+    jobs = [sku for sku in source.unique_skus(skip=checkpoint.done) if in_shard(sku, shard)]
+    
+    if cache is not None:
+        # Use the cached answers for SKUs checked recently
+        unchecked_jobs = []
+        for sku in jobs:
+            result = cached_search(cache, sku)
+            if result is None:
+                unchecked_jobs.append(sku)
+            else:
+                checkpoint.add(sku, result)
+        
+        print(f"{len(jobs) - len(unchecked_jobs)}/{len(jobs)} SKUs served from the cache")
+        jobs = unchecked_jobs
+    
+    if index is not None:
+        # SKUs in the catalogue index are listed, no need to search for them
+        unlisted_jobs = []
+        for sku in jobs:
+            if index.get(sku) is None:
+                unlisted_jobs.append(sku)
+            else:
+                checkpoint.add(sku, outcome_row(sku, SearchOutcome(FOUND)))
+        
+        print(f"{len(jobs) - len(unlisted_jobs)}/{len(jobs)} SKUs found in the catalogue index")
+        jobs = unlisted_jobs
+    
+    # Progress over the SKUs left to check, across both phases
+    progress = Progress(total=len(jobs))
+    finished = 0
     
-    # List to store results
-    results = []
+    # SKUs that need a browser
+    browser_jobs = jobs
     
-    # Setup WebDrivers
-    drivers = [setup_webdriver() for _ in range(max_workers)]
+    if hybrid:
+        browser_jobs = []
+        configure_session(pool_size=http_workers)
+        
+        # Classify as many SKUs as possible from the raw HTML
+        with concurrent.futures.ThreadPoolExecutor(max_workers=http_workers) as executor:
+            http_results = executor.map(functools.partial(http_search, cache=cache), jobs)
+            for sku, result in zip(jobs, http_results):
+                if result is None:
+                    browser_jobs.append(sku)
+                    continue
+                
+                checkpoint.add(sku, result)
+                
+                # Print progress
+                finished += 1
+                progress.update(finished)
+        
+        print(f"{len(browser_jobs)}/{len(jobs)} SKUs need a browser")
+    
+    # Don't start more browsers than there are SKUs left for them
+    pool_size = min(max_workers or MAX_BROWSERS, -(-len(browser_jobs) // tabs) if tabs else len(browser_jobs))
+    
+    # Setup one WebDriver per worker, each thread checks one out per search.
+    # Browsers start in parallel and each is handed out as soon as it is up.
+    # Browsers are recycled as they age, and without a worker count only as many start as fit in memory
+    pool = DriverPool(functools.partial(setup_webdriver, fast=fast), size=pool_size, max_pages=max_pages,
+                      max_rss_mb=max_rss_mb, memory_aware=max_workers is None)
+    pool_size = pool.size
+    
+    finished_lock = threading.Lock()
+    
+    def record_result(sku, outcome, engine='selenium'):
+        nonlocal finished
+        
+        # Uncertain results and errors aren't cached so they are retried next run
+        if cache is not None and outcome.status != UNKNOWN:
+            cache.put(sku, outcome.status, engine, product_count=outcome.product_count)
+        
+        checkpoint.add(sku, outcome_row(sku, outcome))
+        
+        # Print progress
+        with finished_lock:
+            finished += 1
+            done = finished
+        progress.update(done)
     
     try:
-        # Use ThreadPoolExecutor for concurrent searches
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Create a list to track futures
-            future_to_sku = {
-                executor.submit(search_paddy_pallin, drivers[i % max_workers], str(row['Item Code'])): 
-                str(row['Item Code']) 
-                for i, row in df.iterrows()
-            }
+        if browser_fetch and browser_jobs:
+            fetch_queue = queue.Queue()
+            for sku in browser_jobs:
+                fetch_queue.put(sku)
             
-            # Collect results as they complete
-            for future in concurrent.futures.as_completed(future_to_sku):
-                try:
-                    result = future.result()
-                    results.append(result)
+            needs_page_load = []
+            
+            def on_fetch_result(sku, outcome):
+                # Results that only show up once the page's scripts run need a full page load
+                if outcome.status == UNKNOWN:
+                    needs_page_load.append(sku)
+                else:
+                    record_result(sku, outcome, engine='browser_fetch')
+            
+            # One thread per browser, each fetching batches from the shared queue
+            with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor:
+                futures = [
+                    executor.submit(search_with_browser_fetch, pool, fetch_queue, on_fetch_result)
+                    for _ in range(pool_size)
+                ]
+                for future in futures:
+                    future.result()
+            
+            print(f"{len(needs_page_load)}/{len(browser_jobs)} SKUs need a full page load")
+            browser_jobs = needs_page_load
+        
+        if tabs:
+            jobs_queue = queue.Queue()
+            for sku in browser_jobs:
+                jobs_queue.put(sku)
+            
+            # One thread per browser, each keeping its tabs busy from the shared queue
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(pool_size, 1)) as executor:
+                futures = [
+                    executor.submit(search_with_tabs, pool, jobs_queue, tabs, record_result)
+                    for _ in range(pool_size)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            # Use ThreadPoolExecutor for concurrent searches
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(pool_size, 1)) as executor:
+                # Create a list to track futures
+                future_to_sku = {
+                    executor.submit(search_with_pool, pool, sku, cache): sku
+                    for sku in browser_jobs
+                }
+                
+                # Collect results as they complete
+                for future in concurrent.futures.as_completed(future_to_sku):
+                    try:
+                        result = future.result()
+                        checkpoint.add(future_to_sku[future], result)
+                    
+                    except Exception as e:
+                        print(f"Unexpected error: {e}")
+                        
+                        # Still record the SKU, with why it couldn't be checked
+                        sku = future_to_sku[future]
+                        checkpoint.add(sku, outcome_row(sku, unknown(str(e), transient=False)))
                     
                     # Print progress
-                    print(f"Processed SKU: {result['Item Code']}")
-                
-                except Exception as e:
-                    print(f"Unexpected error: {e}")
+                    finished += 1
+                    progress.update(finished)
         
-        # Convert results to DataFrame
-        results_df = pd.DataFrame(results)
+        progress.update(finished, force=True)
         
-        # Save to output Excel file
-        results_df.to_excel(output_file, index=False)
+        if shard is not None:
+            # One row per SKU, fanned out to the input rows when the shards are merged
+            write_results(output_file, checkpoint.records(), OUTPUT_COLUMNS)
+        else:
+            # Fan the results back out to every input row
+            write_fanned_out(output_file, source, dict(checkpoint.items()), OUTPUT_COLUMNS, 'Item Code')
         
         print(f"Results saved to {output_file}")
     
     finally:
-        # Always close all browsers
-        for driver in drivers:
-            driver.quit()
+        # Always close all browsers and write out the finished results
+        pool.close()
+        checkpoint.close()
 
 # Example usage
 if __name__ == "__main__":
@@ -163,5 +473,45 @@ if __name__ == "__main__":
     input_file = './test.xlsx'  # Replace with your input file path
     output_file = 'paddy_pallin_search_results.xlsx'
     
-    # Process with 5 concurrent searches
-    process_excel_file(input_file, output_file, max_workers=5)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Search Paddy Pallin for each SKU")
+    parser.add_argument('--resume', action='store_true', help="Finish a crashed run from its checkpoint")
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help="Only check shard i of N and write a partial result file, run one process or machine per shard")
+    parser.add_argument('--merge', nargs='*', metavar='PARTIAL',
+                        help="Merge the partial result files of a sharded run into the output file "
+                             "(found next to the output file if none are given)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Save the run's timing breakdown and counters (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="Keep every fetched search page in this archive, for re-classifying with page_archive.py")
+    parser.add_argument('--index', metavar='FILE',
+                        help="Only search for SKUs missing from this catalogue index (built with catalogue_index.py)")
+    parser.add_argument('--tabs', type=int, metavar='N',
+                        help="Run N searches at once in each browser's tabs instead of one per browser")
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help=f"Browsers to run at once (default: as many as fit in the free memory, up to {MAX_BROWSERS})")
+    parser.add_argument('--recycle-pages', type=int, default=DEFAULT_MAX_PAGES, metavar='N',
+                        help="Replace each browser with a fresh one after N pages (0 to never)")
+    parser.add_argument('--max-rss-mb', type=float, default=DEFAULT_MAX_RSS_MB, metavar='MB',
+                        help="Replace a browser once it uses more memory than this (0 to never, needs psutil)")
+    parser.add_argument('--browser-fetch', action='store_true',
+                        help="Search with batches of fetch() calls inside each browser's page before loading search pages")
+    args = parser.parse_args()
+    
+    if args.archive:
+        configure_archive(args.archive)
+    
+    if args.merge is not None:
+        merge_shards(input_file, output_file, OUTPUT_COLUMNS, 'Item Code', partial_files=args.merge)
+    else:
+        index = CatalogueIndex.load(args.index) if args.index else None
+        
+        # Answers at3 cached from a missing no results message alone aren't served here
+        cache = ResultCache(engines=DEFINITIVE_ENGINES)
+        try:
+            # Process with concurrent lean browser searches, after a plain HTTP pass
+            process_excel_file(input_file, output_file, max_workers=args.workers, hybrid=True, fast=True, cache=cache, resume=args.resume, shard=args.shard, index=index, tabs=args.tabs, browser_fetch=args.browser_fetch,
+                               max_pages=args.recycle_pages or None, max_rss_mb=args.max_rss_mb or None)
+        finally:
+            cache.close()
+            finish_run(args.metrics)
\ No newline at end of file
@@ -1,93 +1,146 @@
-import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import urllib.parse
+import argparse
+import functools
+from paddy_search import build_search_url, SearchOutcome, unknown, http_error, status_flag, FOUND, NOT_FOUND, UNKNOWN
+from http_session import throttled_get, classify_response, configure_session
+from result_cache import ResultCache
+from catalogue_index import CatalogueIndex
+from checkpoint import Checkpoint, checkpoint_path
+from sku_source import RowSource
+from result_sink import write_fanned_out
+from retry import with_retries
+from metrics import Progress, finish_run
+from page_archive import configure_archive
+from pipeline import Pipeline, parse_search_page, DEFAULT_FETCH_WORKERS, DEFAULT_PARSE_WORKERS
 
-def search_paddy_pallin(search_string):
+# Columns of the output file
+OUTPUT_COLUMNS = ['SKU', 'No Results Found', 'Error']
+
+def check_sku(search_string):
     """
-    Search for a product on Paddy Pallin website and check if no results are found.
+    Search for a product on Paddy Pallin website and classify the result.
     
     Args:
         search_string (str): SKU or product to search
     
     Returns:
-        bool: True if no products found, False otherwise
+        SearchOutcome: NOT_FOUND if no products found, FOUND otherwise,
+            UNKNOWN with the reason if the request failed
     """
-    # Encode the search string for URL
-    encoded_search = urllib.parse.quote(search_string)
-    
     # Construct the search URL
-    url = f"https://www.paddypallin.com.au/nsearch?q={encoded_search}"
+    url = build_search_url(search_string)
     
     try:
-        # Send a request with a user agent to avoid potential blocking
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers)
-        
-        # Check if request was successful
-        if response.status_code != 200:
-            print(f"Error fetching URL for {search_string}: HTTP {response.status_code}")
-            return False
-        
-        # Parse the HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Look for the no results div
-        no_results_div = soup.find('div', class_='nxt-nrf-container')
-        
-        if no_results_div:
-            # Check if the div contains the "did not match any products" text
-            if "did not match any products" in no_results_div.get_text():
-                return True
+        # Send the request over the shared keep-alive session (sets the user agent),
+        # paced by the adaptive rate limiter.
+        # The body is streamed and the connection closed once the page is classified
+        with throttled_get(url, stream=True) as response:
+            # Check if request was successful
+            if response.status_code != 200:
+                print(f"Error fetching URL for {search_string}: HTTP {response.status_code}")
+                return http_error(response.status_code)
+            
+            # Read only as far as the first no results or product marker
+            status = classify_response(response, search_string)
         
-        return False
+        return SearchOutcome(NOT_FOUND if status == NOT_FOUND else FOUND)
     
     except requests.RequestException as e:
+        # Timeouts and dropped connections are worth another try
         print(f"Request error for {search_string}: {e}")
-        return False
+        return unknown(str(e))
 
-def process_excel_file(input_file, output_file):
+def search_paddy_pallin(search_string):
+    """
+    Search for a product on Paddy Pallin website and check if no results are found.
+    
+    Args:
+        search_string (str): SKU or product to search
+    
+    Returns:
+        bool: True if no products found, False otherwise
+    """
+    return with_retries(check_sku, search_string).status == NOT_FOUND
+
+def process_excel_file(input_file, output_file, cache=None, resume=False, index=None, pipeline=False,
+                       fetch_workers=DEFAULT_FETCH_WORKERS, parse_workers=DEFAULT_PARSE_WORKERS):
     """
     Process the Excel file, search for each SKU, and output results.
     
     Args:
-        input_file (str): Path to input Excel file
-        output_file (str): Path to output Excel file
+        input_file (str): Path to input file (.xlsx, .csv or .parquet)
+        output_file (str): Path to output file (.xlsx, .csv or .parquet)
+        cache (ResultCache): Serve recently checked SKUs from this cache
+        resume (bool): Skip SKUs already in the checkpoint of an earlier run
+        index (CatalogueIndex): SKUs known to be listed, only the rest are searched
+        pipeline (bool): Fetch pages on a pool of threads and parse them in a
+            pool of processes instead of one SKU at a time
+        fetch_workers (int): Threads fetching pages in pipeline mode
+        parse_workers (int): Processes parsing pages in pipeline mode
     """
-    # Read the input Excel file
-    df = pd.read_excel(input_file)
+    # Stream SKUs from the input file as they are read
+    source = RowSource(input_file)
     
-    # List to store results
-    results = []
+    # Results are written to the checkpoint as they finish
+    checkpoint = Checkpoint(checkpoint_path(output_file), resume=resume)
     
-    # Iterate through each row
-    for index, row in df.iterrows():
-        sku = str(row['Item Code'])
-        
-        # Check if the SKU returns no results
-        if search_paddy_pallin(sku):
-            results.append({
-                'SKU': sku,
-                'No Results Found': True
-            })
-        else:
-            results.append({
-                'SKU': sku,
-                'No Results Found': False
-            })
+    # The row count is an upper bound on the SKUs to check, so the ETA is too
+    progress = Progress(total=source.total, initial=len(checkpoint.done))
+    
+    def record(sku, outcome):
+        # Check if the SKU returns no results, left blank if it couldn't be checked
+        checkpoint.add(sku, {
+            'SKU': sku,
+            'No Results Found': status_flag(outcome, NOT_FOUND),
+            'Error': outcome.reason
+        })
         
-        # Optional: print progress
-        print(f"Processed {index + 1}/{len(df)} SKUs")
+        # Print progress with the rate and ETA
+        progress.update(len(checkpoint.done))
     
-    # Convert results to DataFrame
-    results_df = pd.DataFrame(results)
+    def on_result(sku, outcome):
+        # Failed requests aren't cached so they are retried next run
+        if outcome.status != UNKNOWN and cache is not None:
+            cache.put(sku, outcome.status, 'at3')
+        record(sku, outcome)
     
-    # Save to output Excel file
-    results_df.to_excel(output_file, index=False)
+    def jobs():
+        # Check each distinct SKU once, skipping those finished by the run being resumed
+        for sku in source.unique_skus(skip=checkpoint.done):
+            # Use the cached answer if the SKU was checked recently
+            status = cache.get(sku) if cache is not None else None
+            
+            # A SKU in the catalogue index is listed, no need to search for it
+            if status is None and index is not None:
+                status = index.get(sku)
+            
+            if status is not None:
+                record(sku, SearchOutcome(status))
+            else:
+                yield sku
+    
+    try:
+        if pipeline:
+            configure_session(pool_size=fetch_workers)
+            
+            # Anything but the no results message counts as found, same as check_sku
+            parse = functools.partial(parse_search_page, inconclusive=FOUND)
+            Pipeline(on_result, parse=parse, fetch_workers=fetch_workers, parse_workers=parse_workers).run(jobs())
+        else:
+            for sku in jobs():
+                # Retry timeouts and throttled requests before giving up on the SKU
+                on_result(sku, with_retries(check_sku, sku))
+        
+        progress.update(len(checkpoint.done), force=True)
+        
+        # Fan the results back out to every input row
+        write_fanned_out(output_file, source, dict(checkpoint.items()), OUTPUT_COLUMNS, 'SKU')
+        
+        print(f"Results saved to {output_file}")
     
-    print(f"Results saved to {output_file}")
+    finally:
+        # Write out the finished results even if the run crashes
+        checkpoint.close()
 
 # Example usage
 if __name__ == "__main__":
@@ -95,4 +148,29 @@ if __name__ == "__main__":
     input_file = './test.xlsx'  # Replace with your input file path
     output_file = 'paddy_pallin_search_results.xlsx'
     
-    process_excel_file(input_file, output_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Check which SKUs return no results on Paddy Pallin")
+    parser.add_argument('--resume', action='store_true', help="Finish a crashed run from its checkpoint")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Save the run's timing breakdown and counters (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="Keep every fetched search page in this archive, for re-classifying with page_archive.py")
+    parser.add_argument('--index', metavar='FILE',
+                        help="Only search for SKUs missing from this catalogue index (built with catalogue_index.py)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Fetch pages on a pool of threads and parse them in a pool of processes")
+    parser.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS, help="Threads fetching pages with --pipeline")
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS, help="Processes parsing pages with --pipeline")
+    args = parser.parse_args()
+    
+    if args.archive:
+        configure_archive(args.archive)
+    
+    index = CatalogueIndex.load(args.index) if args.index else None
+    
+    cache = ResultCache()
+    try:
+        process_excel_file(input_file, output_file, cache=cache, resume=args.resume, index=index, pipeline=args.pipeline,
+                           fetch_workers=args.fetch_workers, parse_workers=args.parse_workers)
+    finally:
+        cache.close()
+        finish_run(args.metrics)
\ No newline at end of file
@@ -0,0 +1,244 @@
+import aiohttp
+import asyncio
+import argparse
+import functools
+import time
+from paddy_search import build_search_url, SearchPageScanner, SearchOutcome, unknown, http_error, status_flag, DEFAULT_HEADERS, FOUND, NOT_FOUND, UNKNOWN
+from result_cache import ResultCache
+from catalogue_index import CatalogueIndex
+from checkpoint import Checkpoint, checkpoint_path
+from sku_source import RowSource
+from result_sink import write_fanned_out
+from at3 import OUTPUT_COLUMNS
+from rate_limit import get_limiter
+from retry import with_retries_async
+from metrics import get_metrics, Progress, finish_run
+from page_archive import get_archive, configure_archive
+
+async def check_sku(session, search_string):
+    """
+    Search for a product on Paddy Pallin website and classify the result.
+
+    Args:
+        session (aiohttp.ClientSession): Shared HTTP session
+        search_string (str): SKU or product to search
+
+    Returns:
+        SearchOutcome: NOT_FOUND if no products found, FOUND otherwise,
+            UNKNOWN with the reason if the request failed
+    """
+    # Construct the search URL
+    url = build_search_url(search_string)
+
+    # Pace the request with the host's adaptive rate limiter
+    metrics = get_metrics()
+    limiter = get_limiter(url)
+    await limiter.acquire_async()
+    started = time.monotonic()
+
+    try:
+        async with session.get(url) as response:
+            latency = time.monotonic() - started
+            limiter.on_response(response.status, response.headers.get('Retry-After'), latency)
+            metrics.observe('ttfb', latency)
+            metrics.inc('requests_total', status=response.status)
+
+            # Check if request was successful
+            if response.status != 200:
+                print(f"Error fetching URL for {search_string}: HTTP {response.status}")
+                return http_error(response.status)
+
+            # Read only as far as the first no results or product marker,
+            # timing the scanning apart from waiting for the body
+            scanner = SearchPageScanner()
+            body_started = time.perf_counter()
+            parse_time = 0.0
+
+            # With archiving on the whole page is read and kept, then scanned in one go
+            archive = get_archive()
+            if archive is not None:
+                body = await response.read()
+                archive.put(search_string, body, url=url, status_code=response.status, engine='aiohttp')
+
+                parse_started = time.perf_counter()
+                scanner.feed(body)
+                parse_time = time.perf_counter() - parse_started
+            else:
+                async for chunk in response.content.iter_chunked(8192):
+                    parse_started = time.perf_counter()
+                    status = scanner.feed(chunk)
+                    parse_time += time.perf_counter() - parse_started
+                    if status is not None:
+                        break
+
+            metrics.observe('download', time.perf_counter() - body_started - parse_time)
+            metrics.observe('parse', parse_time)
+
+            # Drop the connection instead of downloading the rest of the page
+            if scanner.status is not None:
+                response.close()
+
+        return SearchOutcome(NOT_FOUND if scanner.status == NOT_FOUND else FOUND)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        metrics.inc('errors_total', error=type(e).__name__)
+        if isinstance(e, asyncio.TimeoutError):
+            limiter.on_throttle()
+        print(f"Request error for {search_string}: {e}")
+
+        # Timeouts and dropped connections are worth another try
+        return unknown(str(e) or type(e).__name__)
+
+def _connect_trace():
+    # Records how long each new connection took to open, as the connect stage
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        get_metrics().observe('connect', time.perf_counter() - context.connect_started)
+
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+
+    return trace_config
+
+async def search_all(jobs, on_result, concurrency=200, timeout=30, total=None):
+    """
+    Search for every SKU concurrently, keeping up to `concurrency` requests in flight.
+
+    Jobs are pulled from `jobs` only when there is a free slot, so searches
+    start while the input file is still being read.
+
+    Args:
+        jobs (iterable): SKUs to search
+        on_result (callable): Called with (SKU, SearchOutcome) as each search finishes
+        concurrency (int): Maximum number of requests in flight at once
+        timeout (int): Total timeout in seconds for each request
+        total (int): Number of SKUs expected, for the ETA in the progress line
+    """
+    # Let the connector keep as many connections open as requests in flight
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    progress = Progress(total)
+
+    async with aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS, timeout=client_timeout,
+                                     trace_configs=[_connect_trace()]) as session:
+        async def run(sku):
+            # Transient failures are retried inside the SKU's slot, after a jittered backoff
+            outcome = await with_retries_async(functools.partial(check_sku, session), sku)
+            on_result(sku, outcome)
+
+        in_flight = set()
+        completed = 0
+
+        for sku in jobs:
+            # Wait for a free slot before starting the next search
+            while len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                completed += len(done)
+                progress.update(completed)
+
+            in_flight.add(asyncio.create_task(run(sku)))
+
+            # Let the new request go out before reading the next row
+            await asyncio.sleep(0)
+
+        # Wait for the last searches to finish
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            completed += len(done)
+            progress.update(completed)
+
+        progress.update(completed, force=True)
+
+def process_excel_file(input_file, output_file, concurrency=200, cache=None, resume=False, index=None):
+    """
+    Process the Excel file, search for all SKUs concurrently, and output results.
+
+    Args:
+        input_file (str): Path to input file (.xlsx, .csv or .parquet)
+        output_file (str): Path to output file (.xlsx, .csv or .parquet)
+        concurrency (int): Maximum number of requests in flight at once
+        cache (ResultCache): Serve recently checked SKUs from this cache
+        resume (bool): Skip SKUs already in the checkpoint of an earlier run
+        index (CatalogueIndex): SKUs known to be listed, only the rest are searched
+    """
+    # Results are written to the checkpoint as they finish
+    checkpoint = Checkpoint(checkpoint_path(output_file), resume=resume)
+
+    def record(sku, outcome):
+        checkpoint.add(sku, {
+            'SKU': sku,
+            'No Results Found': status_flag(outcome, NOT_FOUND),
+            'Error': outcome.reason
+        })
+
+    def on_result(sku, outcome):
+        # Failed requests aren't cached so they are retried next run
+        if outcome.status != UNKNOWN and cache is not None:
+            cache.put(sku, outcome.status, 'at3_async')
+        record(sku, outcome)
+
+    # Stream SKUs from the input file as they are read
+    source = RowSource(input_file)
+
+    def jobs():
+        # Check each distinct SKU once, skipping those finished by the run being resumed
+        for sku in source.unique_skus(skip=checkpoint.done):
+            # Use the cached answer if the SKU was checked recently
+            status = cache.get(sku) if cache is not None else None
+
+            # A SKU in the catalogue index is listed, no need to search for it
+            if status is None and index is not None:
+                status = index.get(sku)
+
+            if status is not None:
+                record(sku, SearchOutcome(status))
+            else:
+                yield sku
+
+    try:
+        # Run the searches on the event loop
+        # The row count is an upper bound on the SKUs to search, so the ETA is too
+        asyncio.run(search_all(jobs(), on_result, concurrency=concurrency, total=source.total))
+
+        # Fan the results back out to every input row, same layout as the serial at3.py output
+        write_fanned_out(output_file, source, dict(checkpoint.items()), OUTPUT_COLUMNS, 'SKU')
+
+    finally:
+        # Write out the finished results even if the run crashes
+        checkpoint.close()
+
+    print(f"Results saved to {output_file}")
+
+# Example usage
+if __name__ == "__main__":
+    # input_file = './products.xlsx'  # Replace with your input file path
+    input_file = './test.xlsx'  # Replace with your input file path
+    output_file = 'paddy_pallin_search_results.xlsx'
+
+    parser = argparse.ArgumentParser(description="Check which SKUs return no results on Paddy Pallin")
+    parser.add_argument('--resume', action='store_true', help="Finish a crashed run from its checkpoint")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Save the run's timing breakdown and counters (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="Keep every fetched search page in this archive, for re-classifying with page_archive.py")
+    parser.add_argument('--index', metavar='FILE',
+                        help="Only search for SKUs missing from this catalogue index (built with catalogue_index.py)")
+    args = parser.parse_args()
+    
+    if args.archive:
+        configure_archive(args.archive)
+
+    index = CatalogueIndex.load(args.index) if args.index else None
+
+    cache = ResultCache()
+    try:
+        # Keep up to 200 searches in flight
+        process_excel_file(input_file, output_file, concurrency=200, cache=cache, resume=args.resume, index=index)
+    finally:
+        cache.close()
+        finish_run(args.metrics)
@@ -1,25 +1,22 @@
 import pandas as pd
-from bs4 import BeautifulSoup
+from paddy_search import classify_chunks, NOT_FOUND
+from page_archive import PageArchive, DEFAULT_ARCHIVE_DIR
+import os
 
 def check_if_product_not_found(html_content, sku):
     """
-    Check if a product is not found based on HTML content and SKU.
+    Check if a product is not found based on HTML content.
     
     Args:
         html_content (str): The HTML content as a string.
-        sku (str): The SKU to check.
+        sku (str): The SKU the page was searched for. Unused, the page is
+            classified from its markers alone; kept for existing callers.
     
     Returns:
         bool: True if the product is not found, False otherwise.
     """
-    # Parse the HTML content
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Look for the "not found" message
-    not_found_element = soup.find(id="nxt-nrf")
-    if not_found_element and f"Your search - {sku} - did not match any products" in not_found_element.text:
-        return True
-    return False
+    # Scan for the "not found" message, stopping at the first definitive marker
+    return classify_chunks([html_content]) == NOT_FOUND
 
 def process_skus_from_excel(excel_file, html_contents, output_file):
     """
@@ -27,7 +24,8 @@ def process_skus_from_excel(excel_file, html_contents, output_file):
     
     Args:
         excel_file (str): Path to the Excel file with SKUs.
-        html_contents (dict): A dictionary with SKUs as keys and HTML content as values.
+        html_contents (dict): A dictionary with SKUs as keys and HTML content as values,
+            or a PageArchive of fetched search pages.
         output_file (str): Path to save the Excel file with "not found" SKUs.
     """
     # Read SKUs from the Excel file
@@ -53,11 +51,15 @@ def process_skus_from_excel(excel_file, html_contents, output_file):
 
 # Example usage
 if __name__ == "__main__":
-    # Example HTML contents for testing (replace with actual HTML fetched for SKUs)
-    html_contents = {
-        "50931406740S": '<div id="nxt-nrf"> Your search - <strong>50931406740S</strong> - did not match any products<br><br></div>',
-        "51213403473OS": '<div id="amasty-shopby-product-list">...</div>',
-    }
+    if os.path.isdir(DEFAULT_ARCHIVE_DIR):
+        # Search pages archived by an earlier run (--archive), no fetching needed
+        html_contents = PageArchive(DEFAULT_ARCHIVE_DIR)
+    else:
+        # Example HTML contents for testing (replace with actual HTML fetched for SKUs)
+        html_contents = {
+            "50931406740S": '<div id="nxt-nrf"> Your search - <strong>50931406740S</strong> - did not match any products<br><br></div>',
+            "51213403473OS": '<div id="amasty-shopby-product-list">...</div>',
+        }
     
     # Path to the input Excel file
     input_excel = "products.xlsx"  # Replace with the actual file path
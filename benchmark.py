@@ -0,0 +1,490 @@
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Engines the harness can run, HTTP ones first
+HTTP_ENGINES = ['at3', 'at3_async', 'script', 'pipeline']
+SELENIUM_ENGINES = ['5', 'check-if-exists', 'not-exist-check']
+ENGINES = HTTP_ENGINES + SELENIUM_ENGINES
+
+# Kinds of search page the local server serves, picked by the SKU prefix
+PAGE_KINDS = ['found', 'not_found', 'slow', 'throttled', 'malformed']
+
+# Share of SKUs getting each kind of page
+DEFAULT_MIX = 'found=50,not_found=35,slow=5,throttled=5,malformed=5'
+
+# Seconds the slow page takes before it is sent
+DEFAULT_SLOW_DELAY = 2.0
+
+# Size of the filler in front of the results, real search pages carry a few hundred KB of head
+DEFAULT_PAGE_KB = 150
+
+# Prefix of the line a benchmark case prints its result on
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+
+FOUND_PAGE = """<!DOCTYPE html>
+<html><head><title>Search results for: '{sku}'</title>{padding}</head>
+<body>
+<div class="page-title-wrapper"><h1 class="page-title">Search results for: '{sku}'</h1></div>
+<div id="amasty-shopby-product-list">
+<ol class="products list items">
+<li class="item product product-item"><a class="product-item-link" href="/{sku}.html">{sku}</a></li>
+</ol>
+</div>
+</body></html>"""
+
+# Same markup as the example page in attempt2.py, inside the container the browser engines wait for
+NOT_FOUND_PAGE = """<!DOCTYPE html>
+<html><head><title>Search results for: '{sku}'</title>{padding}</head>
+<body>
+<div class="nxt-nrf-container"><div id="nxt-nrf"> Your search - <strong>{sku}</strong> - did not match any products<br><br></div></div>
+</body></html>"""
+
+# Cut off before either marker, like a page from a crashed backend
+MALFORMED_PAGE = """<!DOCTYPE html>
+<html><head><title>Search results for: '{sku}'</title>{padding}</head>
+<body><div class="page-wrapper"><main id="maincontent"""
+
+class SearchPageHandler(BaseHTTPRequestHandler):
+    """
+    Serves a stand-in for the /nsearch page, picked by the SKU's prefix.
+
+    SKUs look like KIND-RUN-NUMBER, e.g. not_found-3-000017. throttled SKUs
+    get a 429 the first time and a found page after that.
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        sku = urllib.parse.parse_qs(url.query).get('q', [''])[0]
+        kind = sku.split('-')[0].lower()
+
+        if url.path != '/nsearch' or kind not in PAGE_KINDS:
+            self.send_error(404)
+            return
+
+        if kind == 'throttled':
+            with self.server.lock:
+                first_request = sku not in self.server.throttled
+                self.server.throttled.add(sku)
+
+            if first_request:
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        if kind == 'slow':
+            time.sleep(self.server.slow_delay)
+
+        if kind == 'not_found':
+            template = self.server.pages['not_found']
+        elif kind == 'malformed':
+            template = self.server.pages['malformed']
+        else:
+            template = self.server.pages['found']
+
+        body = template.replace('{sku}', sku).replace('{padding}', self.server.padding).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output readable
+        pass
+
+def load_pages(pages_dir=None):
+    """
+    Get the page templates, preferring recorded pages where there are any.
+
+    Args:
+        pages_dir (str): Folder with found.html, not_found.html and/or
+            malformed.html saved from the live site. {sku} in them is replaced
+            with the SKU searched for and {padding} with the filler.
+
+    Returns:
+        dict: Page template for each of found, not_found and malformed
+    """
+    pages = {'found': FOUND_PAGE, 'not_found': NOT_FOUND_PAGE, 'malformed': MALFORMED_PAGE}
+
+    if pages_dir:
+        for kind in pages:
+            path = os.path.join(pages_dir, f"{kind}.html")
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    pages[kind] = f.read()
+
+    return pages
+
+def start_server(pages=None, slow_delay=DEFAULT_SLOW_DELAY, page_kb=DEFAULT_PAGE_KB, port=0):
+    """
+    Start the stand-in search server on a background thread.
+
+    Args:
+        pages (dict): Page templates from load_pages()
+        slow_delay (float): Seconds the slow page takes
+        page_kb (int): Size of the filler in each page
+        port (int): Port to listen on, any free port if 0
+
+    Returns:
+        tuple: (server, base URL)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), SearchPageHandler)
+    server.daemon_threads = True
+    server.pages = pages or load_pages()
+    server.slow_delay = slow_delay
+    server.padding = f"<!-- {'x' * (page_kb * 1024)} -->" if page_kb else ''
+    server.throttled = set()
+    server.lock = threading.Lock()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def parse_mix(value):
+    """
+    Parse a --mix argument.
+
+    Args:
+        value (str): Comma separated kind=weight pairs, e.g. "found=90,slow=10"
+
+    Returns:
+        dict: Weight for each page kind
+    """
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in PAGE_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown page kind '{kind}', expected one of {PAGE_KINDS}")
+        mix[kind] = float(weight)
+
+    return mix
+
+def make_skus(count, mix, run=0):
+    """
+    Build the SKUs for a benchmark case, with page kinds spread evenly through them.
+
+    Args:
+        count (int): Number of SKUs
+        mix (dict): Weight for each page kind
+        run (int): Case number, keeps SKUs unique between cases
+
+    Returns:
+        list: SKUs
+    """
+    total = sum(mix.values())
+    kinds = [kind for kind in PAGE_KINDS if mix.get(kind)]
+    credit = dict.fromkeys(kinds, 0.0)
+
+    # Smooth weighted round robin, so every prefix of the list has roughly the same mix
+    skus = []
+    for i in range(count):
+        for kind in kinds:
+            credit[kind] += mix[kind]
+        kind = max(kinds, key=credit.get)
+        credit[kind] -= total
+        skus.append(f"{kind}-{run}-{i:06d}")
+
+    return skus
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of numbers, by the nearest-rank method.
+
+    Args:
+        values (list): Numbers
+        fraction (float): Percentile as a fraction, e.g. 0.95
+
+    Returns:
+        float: The percentile, or None for an empty list
+    """
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+def _load_engine(name):
+    # The scripts have hyphenated file names, so they can't be imported with an import statement
+    return importlib.import_module(name)
+
+def _timed(check):
+    def run(sku):
+        started = time.perf_counter()
+        status = check(sku)
+        return time.perf_counter() - started, status
+
+    return run
+
+def _run_threaded(check, skus, concurrency):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(_timed(check), skus))
+
+def _run_selenium(check, skus, concurrency):
+    from browser import setup_webdriver
+    from driver_pool import DriverPool
+
+    # Browsers are started before the clock is read, so only searches are timed
+    pool = DriverPool(functools.partial(setup_webdriver, fast=True), size=concurrency)
+
+    try:
+        pool.wait_started()
+        started = time.perf_counter()
+        timings = _run_threaded(functools.partial(check, pool), skus, concurrency)
+        return timings, time.perf_counter() - started
+    finally:
+        pool.close()
+
+def run_engine(engine, skus, concurrency):
+    """
+    Check every SKU with one engine.
+
+    Args:
+        engine (str): Name of the engine, one of ENGINES
+        skus (list): SKUs to check
+        concurrency (int): Threads, requests in flight or browsers
+
+    Returns:
+        tuple: (list of (latency, status) per SKU, seconds taken)
+    """
+    from paddy_search import FOUND, NOT_FOUND, UNKNOWN
+    from retry import with_retries
+
+    module = _load_engine(engine)
+
+    if engine in ('at3_async', 'pipeline'):
+        timings = []
+        started_at = {}
+
+        def jobs():
+            for sku in skus:
+                started_at[sku] = time.perf_counter()
+                yield sku
+
+        def on_result(sku, outcome):
+            timings.append((time.perf_counter() - started_at[sku], outcome.status))
+
+        started = time.perf_counter()
+        if engine == 'at3_async':
+            asyncio.run(module.search_all(jobs(), on_result, concurrency=concurrency))
+        else:
+            # Same setup as at3.py --pipeline, concurrency sets the fetch threads
+            parse = functools.partial(module.parse_search_page, inconclusive=FOUND)
+            module.Pipeline(on_result, parse=parse, fetch_workers=concurrency).run(jobs())
+        return timings, time.perf_counter() - started
+
+    if engine == 'at3':
+        check = lambda sku: with_retries(module.check_sku, sku).status
+    elif engine == 'script':
+        check = lambda sku: with_retries(module.check_product, sku).status
+    elif engine == '5':
+        def check(pool, sku):
+            # Same path as 5.py's browser phase, the driver goes back to the pool between retries
+            no_results = module.search_with_pool(pool, sku)['No Results Found']
+            return UNKNOWN if no_results is None else NOT_FOUND if no_results else FOUND
+        return _run_selenium(check, skus, concurrency)
+    else:
+        # check-if-exists.py and not-exist-check.py, retried searches on one driver like their main loop
+        def check(pool, sku):
+            with pool.driver() as driver:
+                return with_retries(functools.partial(module.search_paddy_pallin, driver), sku).status
+        return _run_selenium(check, skus, concurrency)
+
+    started = time.perf_counter()
+    timings = _run_threaded(check, skus, concurrency)
+    return timings, time.perf_counter() - started
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+class _TreeRssSampler:
+    # Samples the summed RSS of this process and its children (browsers), if psutil is installed
+
+    def __init__(self, interval=0.1):
+        try:
+            import psutil
+        except ImportError:
+            self.peak = None
+            return
+
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval, psutil), daemon=True)
+        self._thread.start()
+
+    def _run(self, interval, psutil):
+        while not self._stop.wait(interval):
+            total = 0
+            for process in [self._process] + self._process.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    # Exited between listing and sampling
+                    pass
+            self.peak = max(self.peak, total)
+
+    def stop(self):
+        if self.peak is None:
+            return None
+
+        self._stop.set()
+        self._thread.join()
+        return self.peak / (1024 * 1024)
+
+def run_case(engine, count, concurrency, mix, base_url, rate, run=0):
+    """
+    Run one benchmark case in this process and measure it.
+
+    Args:
+        engine (str): Name of the engine, one of ENGINES
+        count (int): Number of SKUs
+        concurrency (int): Threads, requests in flight or browsers
+        mix (dict): Weight for each page kind
+        base_url (str): Base URL of the stand-in search server
+        rate (float): Requests per second the rate limiter allows
+        run (int): Case number, keeps SKUs unique between cases
+
+    Returns:
+        dict: Throughput, latency percentiles, outcome counts and peak RSS
+    """
+    import paddy_search
+    from rate_limit import configure_limiter
+
+    # Point every engine at the local server
+    paddy_search.SEARCH_URL_TEMPLATE = f"{base_url}/nsearch?q={{query}}"
+    if engine == 'script':
+        _load_engine('script').SEARCH_URL_TEMPLATE = f"{base_url}/nsearch?q={{sku}}"
+
+    # Fixed rate, so the limiter's ramp up doesn't hide the engine's own speed
+    configure_limiter(base_url, rate=rate, max_rate=rate)
+
+    skus = make_skus(count, mix, run=run)
+    sampler = _TreeRssSampler()
+
+    timings, elapsed = run_engine(engine, skus, concurrency)
+
+    tree_rss = sampler.stop()
+    own_rss, child_rss = _peak_rss_mb()
+    latencies = [latency for latency, _ in timings]
+
+    return {
+        'engine': engine,
+        'skus': count,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'skus_per_second': round(len(timings) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'outcomes': dict(Counter(str(status) for _, status in timings)),
+        'peak_rss_mb': round(own_rss, 1),
+        'peak_child_rss_mb': round(child_rss, 1),
+        'peak_tree_rss_mb': round(tree_rss, 1) if tree_rss is not None else None,
+    }
+
+def _run_case_subprocess(engine, count, concurrency, args, base_url, run):
+    # Each case gets a fresh interpreter, so peak RSS and warm pools don't carry over
+    command = [
+        sys.executable, os.path.abspath(__file__), '--case',
+        '--engines', engine, '--counts', str(count), '--concurrency', str(concurrency),
+        '--mix', args.mix, '--rate', str(args.rate), '--base-url', base_url, '--run', str(run),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+
+    error = (completed.stderr.strip().splitlines() or ['no output'])[-1]
+    return {'engine': engine, 'skus': count, 'concurrency': concurrency, 'error': error}
+
+def _print_table(results):
+    columns = ['engine', 'skus', 'concurrency', 'skus_per_second', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb', 'peak_tree_rss_mb']
+    rows = [[str(result.get(column, '')) if result.get(column) is not None else '-' for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result, row in zip(results, rows):
+        line = '  '.join(value.ljust(width) for value, width in zip(row, widths))
+        if 'error' in result:
+            line += f"  error: {result['error']}"
+        print(line)
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SKU checkers against a local stand-in for the search page")
+    parser.add_argument('--engines', default=','.join(HTTP_ENGINES),
+                        help=f"Comma separated engines to run, from {', '.join(ENGINES)} (default: the HTTP engines)")
+    parser.add_argument('--counts', type=_int_list, default=[200], help="Comma separated numbers of SKUs per case")
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 10], help="Comma separated concurrency levels")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Share of each page kind (default: {DEFAULT_MIX})")
+    parser.add_argument('--rate', type=float, default=10000.0, help="Requests per second allowed by the rate limiter")
+    parser.add_argument('--slow-delay', type=float, default=DEFAULT_SLOW_DELAY, help="Seconds the slow page takes")
+    parser.add_argument('--page-kb', type=int, default=DEFAULT_PAGE_KB, help="Size of the filler in each page")
+    parser.add_argument('--pages', help="Folder of recorded found.html, not_found.html and malformed.html pages")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--case', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--run', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    engines = [engine.strip() for engine in args.engines.split(',') if engine.strip()]
+    unknown_engines = [engine for engine in engines if engine not in ENGINES]
+    if unknown_engines:
+        parser.error(f"Unknown engines {unknown_engines}, expected some of {ENGINES}")
+
+    mix = parse_mix(args.mix)
+
+    if args.case:
+        # One case, run by the parent process against its server
+        result = run_case(engines[0], args.counts[0], args.concurrency[0], mix, args.base_url, args.rate, run=args.run)
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    server, base_url = start_server(load_pages(args.pages), slow_delay=args.slow_delay, page_kb=args.page_kb)
+    print(f"Serving stand-in search pages on {base_url}")
+
+    results = []
+    try:
+        run = 0
+        for engine in engines:
+            for count in args.counts:
+                for concurrency in args.concurrency:
+                    run += 1
+                    print(f"Running {engine} with {count} SKUs at concurrency {concurrency}...")
+                    results.append(_run_case_subprocess(engine, count, concurrency, args, base_url, run))
+    finally:
+        server.shutdown()
+
+    print()
+    _print_table(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import JavascriptException, TimeoutException, SessionNotCreatedException
+from webdriver_manager.chrome import ChromeDriverManager
+from collections import namedtuple
+import os
+import threading
+import time
+from paddy_search import NO_RESULTS_TEXT
+from page_archive import get_archive
+
+# URL patterns the fast profile never downloads: images, stylesheets, fonts and trackers
+BLOCKED_URL_PATTERNS = [
+    # Images
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    # Stylesheets
+    '*.css',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Analytics and advertising
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*hotjar.com*', '*bing.com*', '*tiktok.com*', '*pinterest.com*',
+]
+
+# Where the resolved chromedriver path is kept between runs
+DRIVER_PATH_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'paddy', 'chromedriver_path')
+
+# Seconds a cached chromedriver path is trusted before asking webdriver_manager again, to pick up Chrome updates
+DRIVER_PATH_MAX_AGE = 24 * 60 * 60
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def _read_cached_driver_path():
+    try:
+        if time.time() - os.path.getmtime(DRIVER_PATH_CACHE) > DRIVER_PATH_MAX_AGE:
+            return None
+        with open(DRIVER_PATH_CACHE) as f:
+            path = f.read().strip()
+    except OSError:
+        return None
+
+    # The binary may have been cleaned up since
+    return path if path and os.path.isfile(path) else None
+
+def _write_cached_driver_path(path):
+    try:
+        os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+        temp_path = DRIVER_PATH_CACHE + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(path)
+        os.replace(temp_path, DRIVER_PATH_CACHE)
+    except OSError as e:
+        # Only costs a lookup next run
+        print(f"Couldn't cache the chromedriver path: {e}")
+
+def chromedriver_path(refresh=False):
+    """
+    Get the path of the chromedriver binary, resolving it once per machine.
+
+    webdriver_manager checks the installed Chrome version and its own cache
+    on every install() call, so the path it returns is kept in memory and in
+    DRIVER_PATH_CACHE for DRIVER_PATH_MAX_AGE. Threads starting browsers at
+    once share a single lookup.
+
+    Args:
+        refresh (bool): Ask webdriver_manager again, e.g. after Chrome was updated
+
+    Returns:
+        str: Path of the chromedriver binary
+    """
+    global _driver_path
+
+    with _driver_path_lock:
+        if not refresh:
+            if _driver_path is None:
+                _driver_path = _read_cached_driver_path()
+            if _driver_path is not None:
+                return _driver_path
+
+        _driver_path = ChromeDriverManager().install()
+        _write_cached_driver_path(_driver_path)
+        return _driver_path
+
+def setup_webdriver(headless=False, fast=False):
+    """
+    Set up Chrome WebDriver with options for more reliable scraping.
+
+    Args:
+        headless (bool): Run Chrome without a window
+        fast (bool): Use the lean profile: headless, eager page loads and
+            no images, stylesheets, fonts or analytics
+
+    Returns:
+        webdriver.Chrome: Configured Chrome WebDriver
+    """
+    # Chrome options
+    chrome_options = Options()
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    if headless or fast:
+        chrome_options.add_argument("--headless")
+
+    if fast:
+        # Return from driver.get once the DOM is ready instead of waiting for every subresource
+        chrome_options.page_load_strategy = 'eager'
+
+        # Don't even decode images that slip through the URL blocking
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+
+    # Setup the WebDriver
+    try:
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=chrome_options)
+    except SessionNotCreatedException:
+        # The cached chromedriver no longer matches Chrome, look it up again
+        driver = webdriver.Chrome(service=Service(chromedriver_path(refresh=True)), options=chrome_options)
+
+    if fast:
+        # Block the heavy requests at the network layer
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+
+    return driver
+
+# What a search results page currently shows:
+# product_list   the amasty-shopby-product-list container is present
+# product_items  number of product-item elements inside it
+# page_title     the page-title-wrapper is present
+# no_results     the nxt-nrf-container is present with the no results text
+# error          the browser is showing its own error page (connection failed, DNS, ...)
+PageState = namedtuple('PageState', ['product_list', 'product_items', 'page_title', 'no_results', 'error'])
+
+# Reads every marker in one round trip, so a single wait can race them all
+_PAGE_STATE_SCRIPT = """
+var noResultsText = arguments[0];
+var list = document.getElementById('amasty-shopby-product-list');
+var noResults = document.getElementsByClassName('nxt-nrf-container')[0];
+return [
+    !!list,
+    list ? list.getElementsByClassName('product-item').length : 0,
+    document.getElementsByClassName('page-title-wrapper').length > 0,
+    !!noResults && noResults.textContent.indexOf(noResultsText) >= 0,
+    !!document.body && document.body.classList.contains('neterror')
+];
+"""
+
+def read_page_state(driver):
+    """
+    Read which search page markers are currently present.
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver
+
+    Returns:
+        PageState: Markers on the page
+    """
+    return PageState(*driver.execute_script(_PAGE_STATE_SCRIPT, NO_RESULTS_TEXT))
+
+# Marks the page a tab is leaving, a fresh page never has it
+_STALE_FLAG = '__paddyStale'
+
+def start_navigation(driver, url):
+    """
+    Start loading a URL in the current tab without waiting for it.
+
+    The page being left is flagged first, so read_new_page_state() can tell
+    it apart from the page being loaded.
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver, switched to the tab
+        url (str): URL to load
+    """
+    driver.execute_script(f"window.{_STALE_FLAG} = true; window.location.href = arguments[0];", url)
+
+def read_new_page_state(driver):
+    """
+    Read the markers of the page loaded by start_navigation().
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver, switched to the tab
+
+    Returns:
+        PageState: Markers on the page, None while the tab still shows the page it is leaving
+    """
+    state = driver.execute_script(f"if (window.{_STALE_FLAG}) {{ return null; }}\n" + _PAGE_STATE_SCRIPT, NO_RESULTS_TEXT)
+    return PageState(*state) if state is not None else None
+
+def wait_for_search_page(driver, is_settled, timeout=10, poll_frequency=0.1):
+    """
+    Wait until the search page reaches a state the caller can decide on.
+
+    All markers are checked on every poll, so the wait returns as soon as
+    any terminal state shows up instead of waiting out one locator's
+    timeout before trying the next.
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver
+        is_settled (callable): Takes a PageState, True once it is decisive
+        timeout (float): Seconds to wait before giving up
+        poll_frequency (float): Seconds between polls
+
+    Returns:
+        PageState: The first decisive state, or the last one read if the
+            wait timed out (None if none could be read)
+    """
+    last_state = [None]
+
+    def settled(driver):
+        state = read_page_state(driver)
+        last_state[0] = state
+        return state if is_settled(state) else False
+
+    # Scripts can fail while the page is still being swapped in, try again on the next poll
+    wait = WebDriverWait(driver, timeout, poll_frequency=poll_frequency, ignored_exceptions=(JavascriptException,))
+
+    try:
+        return wait.until(settled)
+    except TimeoutException:
+        return last_state[0]
+
+def archive_page_source(driver, search_string, url):
+    """
+    Save the rendered search page to the page archive, if archiving is on.
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver showing the page
+        search_string (str): SKU the page was searched for
+        url (str): URL the page was loaded from
+    """
+    archive = get_archive()
+    if archive is not None:
+        archive.put(search_string, driver.page_source, url=url, engine='selenium')
@@ -0,0 +1,188 @@
+import time
+import urllib.parse
+from paddy_search import build_search_url, SearchOutcome, unknown, http_error, FOUND, NOT_FOUND, NO_RESULTS_TEXT, UNKNOWN
+from rate_limit import get_limiter
+from retry import backoff_delay, DEFAULT_ATTEMPTS, DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY
+from metrics import get_metrics
+from page_archive import get_archive
+
+# Searches fetched at once by one page
+DEFAULT_BATCH_SIZE = 20
+
+# Fetches a batch of search pages from inside the page and classifies them there,
+# with the same markers as paddy_search.classify_search_page. Only a short row per
+# page comes back: [HTTP status (0 if the fetch failed), status, product count,
+# error, milliseconds taken, Retry-After header, page HTML if asked for]
+_FETCH_BATCH_SCRIPT = """
+var urls = arguments[0], noResultsText = arguments[1], timeoutMs = arguments[2];
+var found = arguments[3], notFound = arguments[4], includeHtml = arguments[5];
+var done = arguments[arguments.length - 1];
+
+function classify(html) {
+    var doc = new DOMParser().parseFromString(html, 'text/html');
+    var list = doc.getElementById('amasty-shopby-product-list');
+    if (list) {
+        var items = list.getElementsByClassName('product-item').length;
+        if (items) {
+            return [found, items];
+        }
+    }
+    var noResults = doc.querySelector('div.nxt-nrf-container');
+    if (noResults && noResults.textContent.indexOf(noResultsText) >= 0) {
+        return [notFound, 0];
+    }
+    return [null, 0];
+}
+
+Promise.all(urls.map(function (url) {
+    var controller = new AbortController();
+    var timer = setTimeout(function () { controller.abort(); }, timeoutMs);
+    var started = performance.now();
+
+    return fetch(url, {credentials: 'same-origin', signal: controller.signal})
+        .then(function (response) {
+            return response.text().then(function (html) {
+                var result = response.status === 200 ? classify(html) : [null, 0];
+                return [response.status, result[0], result[1], null, performance.now() - started,
+                        response.headers.get('Retry-After'), includeHtml ? html : null];
+            });
+        })
+        .catch(function (error) {
+            var reason = error.name === 'AbortError' ? 'Timed out fetching the search page' : String(error);
+            return [0, null, 0, reason, performance.now() - started, null, null];
+        })
+        .finally(function () { clearTimeout(timer); });
+})).then(done);
+"""
+
+class BrowserFetcher:
+    """
+    Searches through fetch() calls made from inside one loaded page.
+
+    The site is loaded once, so the browser holds its cookies and passes
+    any bot check, then batches of search pages are fetched in parallel
+    from that page. The pages are classified in the browser and only a
+    short row per SKU crosses back to Python, so searches keep the
+    browser's session at close to plain HTTP speed. The raw HTML is
+    classified, the same as the plain HTTP check, so SKUs whose results
+    only show up once scripts run come back UNKNOWN for a full page load.
+    """
+
+    def __init__(self, driver, batch_size=DEFAULT_BATCH_SIZE, timeout=10,
+                 attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Args:
+            driver (webdriver.Chrome): Selenium WebDriver, used by this fetcher alone
+            batch_size (int): Searches fetched at once
+            timeout (float): Seconds each fetch gets
+            attempts (int): Most fetches per SKU
+            base_delay (float): Backoff cap after the first failed round
+            max_delay (float): Largest backoff cap
+        """
+        self.driver = driver
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _ensure_session(self, url):
+        # Load the site once, fetch() only sends the session's cookies to its own origin
+        parts = urllib.parse.urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+
+        if not self.driver.current_url.startswith(origin):
+            with get_limiter(url).throttled(), get_metrics().timer('navigation'):
+                self.driver.get(origin + '/')
+
+        # Long enough for the whole batch, each fetch is aborted at its own timeout
+        self.driver.set_script_timeout(self.timeout + 5)
+
+    def search_batch(self, skus):
+        """
+        Search for a batch of SKUs at once, without retrying.
+
+        Args:
+            skus (list): SKUs to search
+
+        Returns:
+            list: SearchOutcome for each SKU, in order
+        """
+        metrics = get_metrics()
+        urls = [build_search_url(sku) for sku in skus]
+        self._ensure_session(urls[0])
+
+        limiter = get_limiter(urls[0])
+        for _ in urls:
+            limiter.acquire()
+
+        archive = get_archive()
+        rows = self.driver.execute_async_script(
+            _FETCH_BATCH_SCRIPT, urls, NO_RESULTS_TEXT, int(self.timeout * 1000), FOUND, NOT_FOUND, archive is not None
+        )
+
+        outcomes = []
+        for sku, url, (status_code, status, product_count, error, elapsed_ms, retry_after, html) in zip(skus, urls, rows):
+            if status_code:
+                limiter.on_response(status_code, retry_after, elapsed_ms / 1000)
+                metrics.inc('requests_total', status=status_code)
+            else:
+                limiter.on_throttle()
+                metrics.inc('errors_total', error='fetch')
+
+            # Keep the page for re-classifying later, if archiving is on
+            if html is not None:
+                archive.put(sku, html, url=url, status_code=status_code, engine='browser_fetch')
+
+            if error is not None:
+                outcomes.append(unknown(error))
+            elif status_code != 200:
+                outcomes.append(http_error(status_code))
+            elif status is None:
+                outcomes.append(unknown("Search page inconclusive without a page load", transient=False))
+            else:
+                outcomes.append(SearchOutcome(status, product_count=product_count))
+
+        return outcomes
+
+    def search_all(self, skus):
+        """
+        Search for every SKU in batches, retrying transient failures in later rounds with backoff.
+
+        Args:
+            skus (list): SKUs to search
+
+        Returns:
+            list: SearchOutcome for each SKU, in order
+        """
+        metrics = get_metrics()
+        outcomes = {}
+        pending = list(skus)
+
+        attempt = 1
+        while pending:
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                outcomes.update(zip(batch, self.search_batch(batch)))
+
+            retry = [sku for sku in pending if outcomes[sku].status == UNKNOWN and outcomes[sku].transient]
+            if not retry:
+                break
+
+            if attempt >= self.attempts:
+                for sku in retry:
+                    outcomes[sku] = outcomes[sku]._replace(reason=f"{outcomes[sku].reason} (after {attempt} attempts)")
+                break
+
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            print(f"Retrying {len(retry)} searches in {delay:.1f}s")
+            metrics.inc('retries_total', len(retry))
+            time.sleep(delay)
+            pending = retry
+            attempt += 1
+
+        # Searches in a batch share one clock, so only their outcomes are counted
+        for sku in skus:
+            metrics.inc('checks_total', status=outcomes[sku].status)
+
+        return [outcomes[sku] for sku in skus]
@@ -0,0 +1,251 @@
+import argparse
+import gzip
+import html
+import json
+import os
+import re
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+import requests
+from paddy_search import normalize_sku, FOUND
+from http_session import throttled_get
+from metrics import get_metrics
+
+# Default location of the index file
+DEFAULT_INDEX_FILE = 'catalogue_index.txt'
+
+# Sitemap of the Paddy Pallin website, lists the category and product pages
+DEFAULT_SITEMAP_URL = 'https://www.paddypallin.com.au/sitemap.xml'
+
+# Products requested per listing page, the more per page the fewer fetches
+LISTING_PAGE_SIZE = 100
+
+# Most pages crawled per listing, as a guard against pagination that never ends
+MAX_LISTING_PAGES = 500
+
+# An index older than this (seconds) is reported as stale
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+# Where SKUs show up in listing and product pages:
+# the add to cart form on every product tile, schema.org microdata and JSON-LD
+SKU_PATTERNS = [
+    re.compile(rb'data-product-sku="([^"]+)"'),
+    re.compile(rb'itemprop="sku"[^>]*?content="([^"]+)"'),
+    re.compile(rb'"sku"\s*:\s*"([^"]+)"'),
+]
+
+def extract_skus(page):
+    """
+    Find every SKU on a listing or product page.
+
+    Args:
+        page (bytes): Page HTML
+
+    Returns:
+        set: Normalized SKUs
+    """
+    skus = set()
+    for pattern in SKU_PATTERNS:
+        for match in pattern.finditer(page):
+            sku = normalize_sku(html.unescape(match.group(1).decode('utf-8', errors='replace')))
+            if sku is not None:
+                skus.add(sku)
+
+    return skus
+
+def sitemap_urls(sitemap_url):
+    """
+    List every page URL in a sitemap, following sitemap indexes.
+
+    Args:
+        sitemap_url (str): URL of a sitemap or sitemap index (.xml or .xml.gz)
+
+    Returns:
+        list: Page URLs, in sitemap order
+    """
+    response = throttled_get(sitemap_url, timeout=30)
+    response.raise_for_status()
+
+    content = response.content
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+
+    root = ET.fromstring(content)
+    namespace = root.tag.split('}')[0] + '}' if root.tag.startswith('{') else ''
+    locations = [element.text.strip() for element in root.iter(f"{namespace}loc") if element.text]
+
+    # A sitemap index lists more sitemaps rather than pages
+    if root.tag == f"{namespace}sitemapindex":
+        urls = []
+        for location in locations:
+            urls.extend(sitemap_urls(location))
+        return urls
+
+    return locations
+
+def _page_url(url, page):
+    # Ask for the largest page size the listing allows, one page at a time
+    parts = urllib.parse.urlsplit(url)
+    query = dict(urllib.parse.parse_qsl(parts.query))
+    query.update({'p': str(page), 'product_list_limit': str(LISTING_PAGE_SIZE)})
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+def crawl_listing(url, max_pages=MAX_LISTING_PAGES):
+    """
+    Collect the SKUs from every page of a product listing.
+
+    Pages are fetched until one adds no new SKUs, which is where the
+    listing runs out (Magento repeats the last page past the end). A
+    product page stops after its first page.
+
+    Args:
+        url (str): URL of a category listing (or any page listing SKUs)
+        max_pages (int): Most pages fetched for the listing
+
+    Returns:
+        set: Normalized SKUs
+    """
+    skus = set()
+
+    for page in range(1, max_pages + 1):
+        try:
+            response = throttled_get(_page_url(url, page), timeout=30)
+        except requests.RequestException as e:
+            print(f"Error fetching {url} page {page}: {e}")
+            break
+
+        if response.status_code != 200:
+            print(f"Error fetching {url} page {page}: HTTP {response.status_code}")
+            break
+
+        found = extract_skus(response.content)
+        new_skus = found - skus
+        skus |= found
+
+        # A product page, or the end of the listing
+        if len(new_skus) <= 1:
+            break
+
+    return skus
+
+def build_index(urls, path=DEFAULT_INDEX_FILE):
+    """
+    Crawl listing pages once and save every SKU found as an index.
+
+    Args:
+        urls (list): Listing (or product) page URLs to crawl
+        path (str): Path to write the index to
+
+    Returns:
+        CatalogueIndex: The new index
+    """
+    skus = set()
+    for count, url in enumerate(urls, 1):
+        skus |= crawl_listing(url)
+        print(f"Crawled {count}/{len(urls)} listings, {len(skus)} SKUs so far")
+
+    index = CatalogueIndex(skus, built_at=time.time(), source=f"{len(urls)} listing pages")
+    index.save(path)
+
+    return index
+
+class CatalogueIndex:
+    """
+    Set of every SKU listed on the site, built once by crawling its listings.
+
+    Checking a SKU against the index is a set lookup. A SKU in the index is
+    known to be listed, so only SKUs missing from it need a search request.
+    On disk it is a sorted text file with one SKU per line after a JSON
+    header line.
+    """
+
+    def __init__(self, skus, built_at=None, source=None):
+        """
+        Args:
+            skus (iterable): Normalized SKUs
+            built_at (float): When the listings were crawled (Unix time)
+            source (str): What was crawled, for the header
+        """
+        self.skus = frozenset(skus)
+        self.built_at = built_at
+        self.source = source
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_FILE, max_age=DEFAULT_MAX_AGE):
+        """
+        Read an index file.
+
+        Args:
+            path (str): Path to the index file
+            max_age (float): Seconds after which the index is reported as stale
+
+        Returns:
+            CatalogueIndex: The index
+        """
+        with open(path, encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            index = cls((line.rstrip('\n') for line in f if line.strip()), header.get('built_at'), header.get('source'))
+
+        age = time.time() - (index.built_at or 0)
+        print(f"Loaded {len(index)} SKUs from {path}, built {age / 3600:.0f} hours ago")
+        if max_age is not None and age > max_age:
+            print(f"Warning: {path} is stale, products added since it was built will be searched for")
+
+        return index
+
+    def save(self, path=DEFAULT_INDEX_FILE):
+        """
+        Write the index file, replacing it only once it is complete.
+
+        Args:
+            path (str): Path to the index file
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'built_at': self.built_at, 'source': self.source, 'count': len(self.skus)}) + '\n')
+            for sku in sorted(self.skus):
+                f.write(sku + '\n')
+
+        os.replace(temp_path, path)
+        print(f"Saved {len(self.skus)} SKUs to {path}")
+
+    def __len__(self):
+        return len(self.skus)
+
+    def __contains__(self, sku):
+        return normalize_sku(sku) in self.skus
+
+    def get(self, sku):
+        """
+        Look up a SKU the same way as ResultCache.get.
+
+        Args:
+            sku: SKU to look up
+
+        Returns:
+            str: FOUND if the SKU is listed, None if it needs a search
+        """
+        if sku in self:
+            get_metrics().inc('index_hits_total')
+            return FOUND
+
+        get_metrics().inc('index_misses_total')
+        return None
+
+# Example usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the catalogue index from the site's listings")
+    parser.add_argument('--output', default=DEFAULT_INDEX_FILE, help="Index file to write")
+    parser.add_argument('--sitemap', default=DEFAULT_SITEMAP_URL, help="Sitemap listing the pages to crawl")
+    parser.add_argument('--listing', action='append', metavar='URL',
+                        help="Crawl this listing instead of the sitemap pages (can be repeated)")
+    parser.add_argument('--match', metavar='REGEX',
+                        help="Only crawl sitemap pages whose URL matches, e.g. category pages")
+    args = parser.parse_args()
+
+    urls = args.listing or sitemap_urls(args.sitemap)
+    if args.match:
+        urls = [url for url in urls if re.search(args.match, url)]
+
+    build_index(urls, args.output)
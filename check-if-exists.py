@@ -1,38 +1,22 @@
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import time
-import urllib.parse
+import functools
+import argparse
 from datetime import datetime
+from browser import setup_webdriver, wait_for_search_page, archive_page_source
+from rate_limit import get_limiter
+from paddy_search import build_search_url, SearchOutcome, unknown, status_flag, FOUND, NOT_FOUND, UNKNOWN
+from tiered import http_classify
+from result_cache import ResultCache, DEFINITIVE_ENGINES
+from checkpoint import Checkpoint, checkpoint_path
+from sku_source import RowSource
+from result_sink import write_joined
+from retry import with_retries
+from metrics import get_metrics, Progress, finish_run
+from page_archive import configure_archive
+from driver_pool import DriverPool, DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB
+from catalogue_index import CatalogueIndex
 
 start_time = datetime.now()
 
-def setup_webdriver():
-
-    """
-    Set up Chrome WebDriver with options for more reliable scraping.
-    
-    Returns:
-        webdriver.Chrome: Configured Chrome WebDriver
-    """
-    # Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    # Uncomment the next line to run in headless mode
-    # chrome_options.add_argument("--headless")
-    
-    # Setup the WebDriver
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    
-    return driver
-
 def search_paddy_pallin(driver, search_string):
     """
     Search for a product on Paddy Pallin website and check if a product is found.
@@ -42,116 +26,171 @@ def search_paddy_pallin(driver, search_string):
         search_string (str): SKU or product to search
     
     Returns:
-        bool: True if product is found, False otherwise
+        SearchOutcome: FOUND if a product element showed up, NOT_FOUND if none
+            did, UNKNOWN with the reason if the page couldn't be loaded
     """
-    # Encode the search string for URL
-    encoded_search = urllib.parse.quote(search_string)
-    
     # Construct the search URL
-    url = f"https://www.paddypallin.com.au/nsearch?q={encoded_search}"
+    url = build_search_url(search_string)
     
     try:
-        # Navigate to the URL
-        driver.get(url)
+        # Navigate to the URL, paced by the host's adaptive rate limiter
+        with get_limiter(url).throttled(), get_metrics().timer('navigation'):
+            driver.get(url)
         
-        # Wait for the search results container to load
+        # Wait for the product list or page title wrapper, the no results message
+        # or an error page, whichever shows up first
         # Adjust the timeout as needed (currently set to 10 seconds)
-        wait = WebDriverWait(driver, 10)
+        with get_metrics().timer('dom_wait'):
+            state = wait_for_search_page(
+                driver,
+                lambda state: state.product_list or state.page_title or state.no_results or state.error,
+                timeout=10
+            )
         
-        try:
-            # Try to find product list or page title wrapper
-            # This will look for either the product list or page title to determine if a product exists
-            product_locators = [
-                (By.ID, "amasty-shopby-product-list"),
-                (By.CLASS_NAME, "page-title-wrapper")
-            ]
-            
-            # Check for the existence of either locator
-            for locator_type, locator_value in product_locators:
-                try:
-                    product_element = wait.until(
-                        EC.presence_of_element_located((locator_type, locator_value))
-                    )
-                    # If element is found, return True (product exists)
-                    return True
-                except:
-                    # If this locator isn't found, continue to next
-                    continue
-            
-            # If no locators are found, return False
-            return False
+        # Keep the rendered page for re-classifying later, if archiving is on
+        archive_page_source(driver, search_string, url)
         
-        except Exception as e:
-            # If any unexpected error occurs, print and return False
-            print(f"Error searching for {search_string}: {e}")
-            return False
+        if state is not None and state.error:
+            return unknown("Browser error page")
+        
+        # Either the product list or the page title means a product exists
+        if state is not None and (state.product_list or state.page_title):
+            return SearchOutcome(FOUND)
+        
+        # If neither showed up, assume the product doesn't exist
+        return SearchOutcome(NOT_FOUND)
         
     except Exception as e:
+        # Page loads that time out or fail, or a crashed browser, are worth another try
         print(f"Error searching for {search_string}: {e}")
-        return False
+        get_metrics().inc('errors_total', error=type(e).__name__)
+        return unknown(str(e))
 
-def process_excel_file(input_file, output_file):
+def process_excel_file(input_file, output_file, hybrid=False, fast=False, cache=None, resume=False, index=None,
+                       max_pages=DEFAULT_MAX_PAGES, max_rss_mb=DEFAULT_MAX_RSS_MB):
     """
     Process the Excel file, search for each SKU, and output results.
     
     Args:
-        input_file (str): Path to input Excel file
-        output_file (str): Path to output Excel file
+        input_file (str): Path to input file (.xlsx, .csv or .parquet)
+        output_file (str): Path to output file (.xlsx, .csv or .parquet)
+        hybrid (bool): Try a plain HTTP check first and only use the browser
+            for SKUs it can't classify
+        fast (bool): Use the lean browser profile (headless, eager page
+            loads, no images, stylesheets, fonts or analytics)
+        cache (ResultCache): Serve recently checked SKUs from this cache
+        resume (bool): Skip SKUs already in the checkpoint of an earlier run
+        index (CatalogueIndex): SKUs known to be listed, only the rest are searched
+        max_pages (int): Pages the browser loads before it is replaced with a
+            fresh one, None for no limit
+        max_rss_mb (float): Memory in MB the browser may use before it is
+            replaced with a fresh one, None for no limit
     """
-    # Setup WebDriver
-    driver = setup_webdriver()
+    # Setup WebDriver only once a SKU isn't answered by the cache or the HTTP check.
+    # It is kept in a pool of one, so it is replaced when it crashes or ages
+    pool = None
+    
+    def search_once(search_string):
+        # Each search counts as a page towards recycling the browser
+        with pool.driver() as driver:
+            return search_paddy_pallin(driver, search_string)
+    
+    # Results are written to the checkpoint as they finish
+    checkpoint = Checkpoint(checkpoint_path(output_file), resume=resume)
     
     try:
-        # Read the input Excel file
-        df = pd.read_excel(input_file)
+        # Stream rows from the input file as they are read
+        source = RowSource(input_file)
         
-        # List to store results
-        results = []
+        # The row count is an upper bound on the SKUs to check, so the ETA is too
+        progress = Progress(total=source.total, initial=len(checkpoint.done))
         
-        # Iterate through each row
-        for index, row in df.iterrows():
-            sku = str(row['Item Code'])
-            
+        # Check each distinct SKU once, skipping those finished by the run being resumed.
+        # The rest of the row is joined back on at the end
+        for sku in source.unique_skus(skip=checkpoint.done):
             # Check if the SKU returns product exists
             try:
-                product_exists = search_paddy_pallin(driver, sku)
-                row_data = row.to_dict()  # Convert the row to a dictionary
-                row_data['Product Exists'] = product_exists
-                results.append(row_data)                
+                # Use the cached answer if the SKU was checked recently
+                status = cache.get(sku) if cache is not None else None
+                
+                # A SKU in the catalogue index is listed, no need to search for it
+                if status is None and index is not None:
+                    status = index.get(sku)
+                
+                outcome = SearchOutcome(status) if status is not None else None
                 
-                # Add a small delay between searches to reduce load on the server
-                time.sleep(1)
+                if outcome is None and hybrid:
+                    # Try the cheap HTTP check first, retrying failed requests
+                    outcome = with_retries(http_classify, sku)
+                    if outcome.status != UNKNOWN and cache is not None:
+                        cache.put(sku, outcome.status, 'http')
+                
+                if outcome is None or outcome.status == UNKNOWN:
+                    if pool is None:
+                        pool = DriverPool(functools.partial(setup_webdriver, fast=fast), size=1, max_pages=max_pages, max_rss_mb=max_rss_mb)
+                    outcome = with_retries(search_once, sku)
+                    
+                    # Only a matched product element is definitive, NOT_FOUND is assumed when none shows up
+                    if outcome.status == FOUND and cache is not None:
+                        cache.put(sku, FOUND, 'selenium')
+                
+                # Only the SKU and its result are kept, left blank if it couldn't be checked
+                checkpoint.add(sku, {'Item Code': sku, 'Product Exists': status_flag(outcome, FOUND), 'Error': outcome.reason})
             except Exception as e:
                 print(f"Error processing SKU {sku}: {e}")
                 
-                # Add the error information to the row and append
-                row_data = row.to_dict()
-                row_data['Product Exists'] = None
-                row_data['Error'] = str(e)
-                
-                results.append(row_data) 
+                # Add the error information to the result
+                checkpoint.add(sku, {'Item Code': sku, 'Product Exists': None, 'Error': str(e)})
 
-            # Optional: print progress
-            print(f"Processed {index + 1}/{len(df)} SKUs")
+            # Print progress with the rate and ETA
+            progress.update(len(checkpoint.done))
         
-        # Convert results to DataFrame
-        results_df = pd.DataFrame(results)
+        progress.update(len(checkpoint.done), force=True)
         
-        # Save to output Excel file
-        results_df.to_excel(output_file, index=False)
+        # SKU -> result mapping, fanned back out to every input row in one pass
+        write_joined(output_file, source, dict(checkpoint.items()), ['Product Exists', 'Error'])
         
         print(f"Results saved to {output_file}")
     
     finally:
-        # Always close the browser
-        driver.quit()
+        # Always close the browser and write out the finished results
+        if pool is not None:
+            pool.close()
+        checkpoint.close()
 
 # Example usage
 if __name__ == "__main__":
     input_file = 'test.xlsx'  # Replace with your input file path
     output_file = 'paddy_pallin_search_results_exist_check.xlsx'
     
-    process_excel_file(input_file, output_file)
+    parser = argparse.ArgumentParser(description="Check which SKUs exist on Paddy Pallin")
+    parser.add_argument('--resume', action='store_true', help="Finish a crashed run from its checkpoint")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Save the run's timing breakdown and counters (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="Keep every fetched search page in this archive, for re-classifying with page_archive.py")
+    parser.add_argument('--index', metavar='FILE',
+                        help="Only search for SKUs missing from this catalogue index (built with catalogue_index.py)")
+    parser.add_argument('--recycle-pages', type=int, default=DEFAULT_MAX_PAGES, metavar='N',
+                        help="Replace the browser with a fresh one after N pages (0 to never)")
+    parser.add_argument('--max-rss-mb', type=float, default=DEFAULT_MAX_RSS_MB, metavar='MB',
+                        help="Replace the browser once it uses more memory than this (0 to never, needs psutil)")
+    args = parser.parse_args()
+    
+    if args.archive:
+        configure_archive(args.archive)
+    
+    index = CatalogueIndex.load(args.index) if args.index else None
+    
+    # Answers at3 cached from a missing no results message alone aren't served here
+    cache = ResultCache(engines=DEFINITIVE_ENGINES)
+    try:
+        # Only start the browser for SKUs the plain HTTP check can't classify
+        process_excel_file(input_file, output_file, hybrid=True, fast=True, cache=cache, resume=args.resume, index=index,
+                           max_pages=args.recycle_pages or None, max_rss_mb=args.max_rss_mb or None)
+    finally:
+        cache.close()
+        finish_run(args.metrics)
 
 
     end_time = datetime.now()
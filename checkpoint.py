@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+# Number of results buffered before they are written to disk
+DEFAULT_BATCH_SIZE = 100
+
+def checkpoint_path(output_file):
+    """
+    Get the checkpoint file used for an output file.
+
+    Args:
+        output_file (str): Path to the output file of the run
+
+    Returns:
+        str: Path to the checkpoint file
+    """
+    return f"{output_file}.checkpoint.jsonl"
+
+def _to_json(value):
+    # numpy and pandas scalars (int64, Timestamp, ...) from DataFrame rows
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+class Checkpoint:
+    """
+    Append-only log of finished results, so a crashed run can be resumed.
+
+    Each result is one JSON line holding its key (the normalized SKU it is
+    for) and the output record. Results are buffered and written in batches,
+    each batch fsynced so it survives a crash.
+    """
+
+    def __init__(self, path, resume=False, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Open the checkpoint file.
+
+        Args:
+            path (str): Path to the checkpoint file
+            resume (bool): Keep the results already in the file, otherwise start over
+            batch_size (int): Number of results buffered before each write
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.done = set()
+        self._buffer = []
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            self._load()
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+
+            # Drop a line cut short by a crash mid-write
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+
+        for line in data[:end].splitlines():
+            self.done.add(json.loads(line)['key'])
+
+        print(f"Resuming: {len(self.done)} results already in {self.path}")
+
+    def add(self, key, record):
+        """
+        Record a finished result.
+
+        Args:
+            key: Identifies what the result is for, normally the normalized SKU
+            record (dict): Output record
+        """
+        with self._lock:
+            self._buffer.append(json.dumps({'key': key, 'record': record}, default=_to_json))
+            self.done.add(key)
+
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        self._file.write('\n'.join(self._buffer) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = []
+
+    def flush(self):
+        """
+        Write any buffered results to disk.
+        """
+        with self._lock:
+            self._flush()
+
+    def items(self):
+        """
+        Read back every result in the checkpoint, in the order they finished.
+
+        Yields:
+            tuple: (key, output record)
+        """
+        self.flush()
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                yield entry['key'], entry['record']
+
+    def records(self):
+        """
+        Read back every result in the checkpoint, in the order they finished.
+
+        Yields:
+            dict: Output record
+        """
+        for _, record in self.items():
+            yield record
+
+    def close(self):
+        """
+        Write any buffered results and close the file.
+        """
+        with self._lock:
+            self._flush()
+            self._file.close()
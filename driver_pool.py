@@ -0,0 +1,365 @@
+from selenium.common.exceptions import WebDriverException
+from contextlib import contextmanager
+import concurrent.futures
+import os
+import queue
+import threading
+from metrics import get_metrics
+
+# Pages a browser loads before it is replaced with a fresh one
+DEFAULT_MAX_PAGES = 500
+
+# Memory (MB) a browser may use before it is replaced with a fresh one
+DEFAULT_MAX_RSS_MB = 1500
+
+# Memory (MB) left free for everything else when sizing the pool
+DEFAULT_MEMORY_RESERVE_MB = 1024
+
+# Least memory (MB) budgeted per browser, a fresh one grows well past what it starts at
+DEFAULT_DRIVER_FOOTPRINT_MB = 400
+
+def driver_rss_mb(driver):
+    """
+    Measure the memory used by a driver's browser: chromedriver, Chrome and every Chrome process.
+
+    Args:
+        driver (webdriver.Chrome): Driver to measure
+
+    Returns:
+        float: Resident memory in MB, None if psutil isn't installed or the browser is gone
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    try:
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+    except (psutil.Error, AttributeError):
+        return None
+
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            # Exited between listing and measuring
+            pass
+
+    return total / (1024 * 1024)
+
+def available_memory_mb():
+    """
+    Get how much memory the machine has free for new browsers.
+
+    Returns:
+        float: Available memory in MB, None if it can't be read
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+
+    # Linux without psutil
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+class DriverPool:
+    """
+    Pool of WebDrivers handed out to one thread at a time.
+
+    A thread checks a driver out, has exclusive use of it, and checks it
+    back in when done. Drivers that stop responding are quit and replaced
+    with a fresh one from `factory`, and so are drivers that have loaded
+    max_pages pages or grown past max_rss_mb, as Chrome's memory keeps
+    growing over a long run.
+
+    Only the first driver is started before the pool is returned; the rest
+    start in parallel in the background and join the pool as each becomes
+    ready, so the first search waits for one browser launch rather than all.
+    """
+
+    def __init__(self, factory, size, max_pages=None, max_rss_mb=None, memory_aware=False,
+                 reserve_mb=DEFAULT_MEMORY_RESERVE_MB):
+        """
+        Start `size` drivers: one now, the rest in the background.
+
+        Args:
+            factory (callable): Function returning a new webdriver.Chrome
+            size (int): Number of drivers in the pool, the most it may have when memory_aware
+            max_pages (int): Pages a driver loads before it is recycled, None for no limit
+            max_rss_mb (float): Memory in MB a driver may use before it is recycled,
+                None for no limit (needs psutil)
+            memory_aware (bool): Start only as many drivers as fit in the
+                available memory, given the footprint of the first one
+            reserve_mb (float): Memory in MB left free when memory_aware
+        """
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.Queue()
+        self._all = []
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._launches = []
+
+        if size <= 0:
+            return
+
+        # Started here so a browser that can't start at all fails the run straight away
+        first = self._timed_start()
+        self._add(first)
+
+        if memory_aware:
+            self.size = self._fit_to_memory(first, size, reserve_mb)
+
+        if self.size > 1:
+            launcher = concurrent.futures.ThreadPoolExecutor(max_workers=self.size - 1)
+            self._launches = [launcher.submit(self._launch) for _ in range(self.size - 1)]
+            launcher.shutdown(wait=False)
+
+    def _timed_start(self):
+        with get_metrics().timer('driver_start'):
+            return self.factory()
+
+    def _launch(self):
+        try:
+            driver = self._timed_start()
+        except Exception as e:
+            # Carry on with the drivers that did start
+            print(f"Error starting WebDriver: {e}")
+            get_metrics().inc('errors_total', error='driver_start')
+            with self._lock:
+                self.size -= 1
+            return
+
+        if self._closed:
+            self._discard(driver)
+            return
+
+        self._add(driver)
+
+    def wait_started(self):
+        """
+        Wait until every driver started in the background is up (or failed to start).
+
+        Returns:
+            int: Number of drivers in the pool
+        """
+        concurrent.futures.wait(self._launches)
+        return self.size
+
+    def _fit_to_memory(self, driver, size, reserve_mb):
+        available = available_memory_mb()
+        if available is None:
+            print(f"Can't read the free memory, starting {size} WebDrivers")
+            return size
+
+        # A driver may grow up to the recycling ceiling, otherwise budget what it uses now, with a floor
+        footprint = self.max_rss_mb or max(driver_rss_mb(driver) or 0, DEFAULT_DRIVER_FOOTPRINT_MB)
+        fitted = max(1, min(size, 1 + int((available - reserve_mb) // footprint)))
+
+        print(f"Starting {fitted} WebDrivers: {available:.0f} MB free, {footprint:.0f} MB budgeted for each")
+        return fitted
+
+    def _add(self, driver):
+        with self._lock:
+            self._all.append(driver)
+            self._pages[driver] = 0
+        self._idle.put(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._all:
+                self._all.remove(driver)
+            self._pages.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            # The browser is already gone
+            pass
+
+    def is_healthy(self, driver):
+        """
+        Check that a driver still responds to commands.
+
+        Args:
+            driver (webdriver.Chrome): Driver to check
+
+        Returns:
+            bool: True if the browser session is usable, False otherwise
+        """
+        try:
+            # Any round trip to the browser fails once the session has crashed
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def replace(self, driver, reason="crashed"):
+        """
+        Quit a driver and start a new one in its place.
+
+        Args:
+            driver (webdriver.Chrome): Driver to replace
+            reason (str): Why it is replaced, for the log
+
+        Returns:
+            webdriver.Chrome: The new driver (not yet in the idle queue)
+        """
+        print(f"Replacing WebDriver: {reason}")
+        self._discard(driver)
+        new_driver = self._timed_start()
+        with self._lock:
+            self._all.append(new_driver)
+            self._pages[new_driver] = 0
+        return new_driver
+
+    def add_pages(self, driver, count=1):
+        """
+        Count pages loaded by a driver, towards recycling it.
+
+        Args:
+            driver (webdriver.Chrome): Driver that loaded the pages
+            count (int): Number of pages
+        """
+        with self._lock:
+            if driver in self._pages:
+                self._pages[driver] += count
+
+    def pages_left(self, driver):
+        """
+        Get how many more pages a driver may load before it is recycled.
+
+        Args:
+            driver (webdriver.Chrome): Driver to check
+
+        Returns:
+            int: Pages left, None if there is no page limit
+        """
+        if self.max_pages is None:
+            return None
+
+        with self._lock:
+            return max(0, self.max_pages - self._pages.get(driver, 0))
+
+    def _recycle_reason(self, driver):
+        # Why a healthy driver should be replaced with a fresh one, None to keep it
+        pages_left = self.pages_left(driver)
+        if pages_left is not None and pages_left <= 0:
+            return f"recycled after {self.max_pages} pages", 'pages'
+
+        if self.max_rss_mb is not None:
+            rss = driver_rss_mb(driver)
+            if rss is not None and rss > self.max_rss_mb:
+                return f"recycled at {rss:.0f} MB", 'rss'
+
+        return None
+
+    def checkout(self, timeout=None):
+        """
+        Take an idle driver from the pool, waiting for one if all are busy.
+
+        Args:
+            timeout (float): Seconds to wait for a free driver (None waits forever)
+
+        Returns:
+            webdriver.Chrome: A healthy driver for exclusive use
+        """
+        # Time spent waiting for a free driver counts as queueing
+        with get_metrics().timer('queue_wait'):
+            driver = self._idle.get(timeout=timeout)
+
+        if not self.is_healthy(driver):
+            try:
+                driver = self.replace(driver)
+            except Exception:
+                # Put the slot back so other threads don't wait on a driver that will never return
+                self._idle.put(driver)
+                raise
+
+        return driver
+
+    def checkin(self, driver, healthy=True):
+        """
+        Return a driver to the pool.
+
+        Args:
+            driver (webdriver.Chrome): Driver taken with checkout()
+            healthy (bool): False if the driver is known to be broken
+        """
+        if self._closed:
+            self._discard(driver)
+            return
+
+        reason = None
+        if not healthy:
+            reason = "crashed"
+        else:
+            recycle = self._recycle_reason(driver)
+            if recycle is not None:
+                reason, limit = recycle
+                get_metrics().inc('driver_recycles_total', limit=limit)
+
+        if reason is not None:
+            try:
+                driver = self.replace(driver, reason)
+            except Exception as e:
+                # Keep the pool size by putting the old one back, checkout() will retry the replacement
+                print(f"Error starting replacement WebDriver: {e}")
+
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self, timeout=None, pages=1):
+        """
+        Check out a driver for the duration of a with block.
+
+        Args:
+            timeout (float): Seconds to wait for a free driver (None waits forever)
+            pages (int): Pages the block loads, counted towards recycling the
+                driver (0 if the block counts them itself with add_pages)
+
+        Yields:
+            webdriver.Chrome: A driver for exclusive use
+        """
+        driver = self.checkout(timeout=timeout)
+        self.add_pages(driver, pages)
+        healthy = True
+        try:
+            yield driver
+        except WebDriverException:
+            healthy = self.is_healthy(driver)
+            raise
+        finally:
+            self.checkin(driver, healthy=healthy)
+
+    def close(self):
+        """
+        Quit every driver in the pool, including any still starting.
+        """
+        self._closed = True
+
+        # Drivers still starting quit themselves once up, wait for them so no browser is left behind
+        for launch in self._launches:
+            launch.cancel()
+        concurrent.futures.wait(self._launches)
+
+        with self._lock:
+            drivers = list(self._all)
+        for driver in drivers:
+            self._discard(driver)
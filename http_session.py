@@ -0,0 +1,184 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import threading
+import time
+from paddy_search import DEFAULT_HEADERS, classify_chunks
+from rate_limit import get_limiter
+from metrics import get_metrics, TimedIterator
+from page_archive import get_archive
+
+# Number of keep-alive connections kept open to each host
+DEFAULT_POOL_SIZE = 20
+
+_session = None
+_session_lock = threading.Lock()
+
+# Connections that record how long opening them took
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with get_metrics().timer('connect'):
+            super().connect()
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with get_metrics().timer('connect'):
+            super().connect()
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    # Pools that open timed connections, so new TCP/TLS connections show up in the connect stage
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, headers=None):
+    """
+    Create a requests session with a connection pool and default headers.
+
+    Args:
+        pool_size (int): Number of keep-alive connections kept open to each host
+        headers (dict): Headers sent with every request (defaults to DEFAULT_HEADERS)
+
+    Returns:
+        requests.Session: Configured session
+    """
+    session = requests.Session()
+
+    # Reuse connections so each request skips the TCP connect and TLS handshake
+    adapter = _TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+
+    return session
+
+def get_session():
+    """
+    Get the shared session, creating it on first use.
+
+    The session is shared by all threads; the connection pool handles
+    handing out connections to concurrent requests.
+
+    Returns:
+        requests.Session: Shared session
+    """
+    global _session
+
+    # Double-checked so threads only take the lock while the session is missing
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+
+    return _session
+
+def configure_session(pool_size=DEFAULT_POOL_SIZE, headers=None):
+    """
+    Replace the shared session, e.g. to size the pool for the number of worker threads.
+
+    Args:
+        pool_size (int): Number of keep-alive connections kept open to each host
+        headers (dict): Headers sent with every request (defaults to DEFAULT_HEADERS)
+
+    Returns:
+        requests.Session: The new shared session
+    """
+    global _session
+
+    with _session_lock:
+        old_session = _session
+        _session = create_session(pool_size=pool_size, headers=headers)
+
+    # Close the old pooled connections
+    if old_session is not None:
+        old_session.close()
+
+    return _session
+
+def throttled_get(url, **kwargs):
+    """
+    Send a GET over the shared session, paced by the host's adaptive rate limiter.
+
+    Waits for the limiter before sending, then reports the response status,
+    Retry-After header, latency or timeout back to it. Time to first byte,
+    the status and any error are recorded in the run's metrics.
+
+    Args:
+        url (str): URL to fetch
+        **kwargs: Passed on to requests.Session.get
+
+    Returns:
+        requests.Response: The response
+    """
+    metrics = get_metrics()
+    limiter = get_limiter(url)
+    limiter.acquire()
+
+    started = time.monotonic()
+    try:
+        response = get_session().get(url, **kwargs)
+    except requests.RequestException as e:
+        metrics.inc('errors_total', error=type(e).__name__)
+        if isinstance(e, requests.Timeout):
+            limiter.on_throttle()
+        raise
+
+    latency = time.monotonic() - started
+    limiter.on_response(response.status_code, response.headers.get('Retry-After'), latency)
+
+    # elapsed stops once the headers are parsed; without stream=True the body is already read too
+    ttfb = response.elapsed.total_seconds()
+    metrics.observe('ttfb', ttfb)
+    if not kwargs.get('stream'):
+        metrics.observe('download', max(0.0, latency - ttfb))
+    metrics.inc('requests_total', status=response.status_code)
+
+    return response
+
+def classify_response(response, search_string=None, chunk_size=8192):
+    """
+    Classify a streamed search results page, reading only as far as the first definitive marker.
+
+    The time spent waiting for the body and the time spent scanning it are
+    recorded separately, as the download and parse stages. When the page
+    archive is on, the whole page is read and archived first.
+
+    Args:
+        response (requests.Response): Response fetched with stream=True
+        search_string (str): SKU the page was searched for, needed for archiving
+        chunk_size (int): Bytes read at a time
+
+    Returns:
+        str: FOUND or NOT_FOUND, None if the page had neither marker
+    """
+    archive = get_archive()
+    if archive is not None and search_string is not None:
+        with get_metrics().timer('download'):
+            body = response.content
+        archive.put(search_string, body, url=response.url, status_code=response.status_code, engine='http')
+
+        with get_metrics().timer('parse'):
+            return classify_chunks([body])
+
+    chunks = TimedIterator(response.iter_content(chunk_size=chunk_size))
+
+    started = time.perf_counter()
+    status = classify_chunks(chunks)
+    total = time.perf_counter() - started
+
+    metrics = get_metrics()
+    metrics.observe('download', chunks.elapsed)
+    metrics.observe('parse', total - chunks.elapsed)
+
+    return status
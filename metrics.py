@@ -0,0 +1,352 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, the last one catches everything
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'paddy_'
+
+# Where a check's time can go:
+# queue_wait     waiting for the rate limiter or a free driver
+# connect        opening a new TCP/TLS connection
+# ttfb           sending the request until the response headers arrive
+# download       reading the response body
+# parse          classifying the page
+# navigation     driver.get() in a browser
+# dom_wait       waiting for result elements to show up in the browser
+# check          the whole check of one SKU, retries included
+STAGES = ['queue_wait', 'connect', 'ttfb', 'download', 'parse', 'navigation', 'dom_wait', 'check']
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, the same way a Prometheus histogram does.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Args:
+            fraction (float): Quantile as a fraction, e.g. 0.95
+
+        Returns:
+            float: Estimated quantile in seconds, None without observations
+        """
+        if not self.count:
+            return None
+
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                # The overflow bucket has no upper bound, the largest value seen is the best guess
+                return min(bound, self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+class Metrics:
+    """
+    Thread-safe store of per-stage timing histograms and labelled counters.
+
+    Stages are timed with observe() or the timer() context manager, and
+    events (requests by status, retries, cache hits, errors by class) are
+    counted with inc(). Everything can be exported as JSON or in the
+    Prometheus text format.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """
+        Record time spent in a stage.
+
+        Args:
+            stage (str): Stage name, normally one of STAGES
+            seconds (float): Time spent
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Time the with block as a stage, whether or not it raises.
+
+        Args:
+            stage (str): Stage name, normally one of STAGES
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): Counter name, e.g. 'requests_total'
+            amount (int): Amount to add
+            **labels: Labels telling the counter's series apart, e.g. status=429
+        """
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter(self, name, **labels):
+        """
+        Get a counter's value.
+
+        Args:
+            name (str): Counter name
+            **labels: Only count series with these labels, all series if none are given
+
+        Returns:
+            int: Sum of the matching series
+        """
+        wanted = {(label, str(value)) for label, value in labels.items()}
+        with self._lock:
+            return sum(
+                value for (counter_name, series), value in self._counters.items()
+                if counter_name == name and wanted <= set(series)
+            )
+
+    def to_dict(self):
+        """
+        Get every metric as plain data.
+
+        Returns:
+            dict: Run time, histogram summaries by stage and counter series
+        """
+        with self._lock:
+            counters = {}
+            for (name, series), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({'labels': dict(series), 'value': value})
+
+            return {
+                'elapsed_seconds': round(time.monotonic() - self.started, 3),
+                'stages': {stage: histogram.to_dict() for stage, histogram in sorted(self._histograms.items())},
+                'counters': counters,
+            }
+
+    def to_json(self):
+        """
+        Returns:
+            str: Every metric as JSON
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format
+        """
+        lines = []
+
+        with self._lock:
+            if self._histograms:
+                name = f"{METRIC_PREFIX}stage_seconds"
+                lines.append(f"# HELP {name} Time spent in each stage of a SKU check")
+                lines.append(f"# TYPE {name} histogram")
+                for stage, histogram in sorted(self._histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            typed = set()
+            for (counter_name, series), value in sorted(self._counters.items()):
+                name = f"{METRIC_PREFIX}{counter_name}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+
+                labels = ','.join(f'{label}="{_escape_label(label_value)}"' for label, label_value in series)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Save every metric to a file, in Prometheus text format for .prom files and JSON otherwise.
+
+        Args:
+            path (str): Path to the metrics file
+        """
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        print(f"Metrics saved to {path}")
+
+    def summary(self):
+        """
+        Get a short report of where the time went, one line per stage.
+
+        Returns:
+            str: Report text
+        """
+        data = self.to_dict()
+        lines = [f"Run time {data['elapsed_seconds']:.1f}s"]
+
+        for stage in STAGES + sorted(set(data['stages']) - set(STAGES)):
+            histogram = data['stages'].get(stage)
+            if histogram is None:
+                continue
+
+            lines.append(
+                f"  {stage:<11} n={histogram['count']:<7} total={histogram['sum']:.1f}s "
+                f"mean={histogram['mean'] * 1000:.0f}ms p95<={histogram['p95'] * 1000:.0f}ms"
+            )
+
+        for name, series in data['counters'].items():
+            parts = ', '.join(
+                (','.join(f"{label}={value}" for label, value in entry['labels'].items()) or 'all') + f": {entry['value']}"
+                for entry in series
+            )
+            lines.append(f"  {name}: {parts}")
+
+        return '\n'.join(lines)
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class TimedIterator:
+    """
+    Wraps an iterator and adds up the time spent waiting for its items.
+
+    Used on a response body so the time spent downloading can be told apart
+    from the time spent classifying the chunks as they arrive.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+class Progress:
+    """
+    Prints a progress line with the current rate and an ETA, at most once per interval.
+    """
+
+    def __init__(self, total=None, interval=1.0, label='SKUs', initial=0):
+        """
+        Args:
+            total (int): Number of items expected, None if unknown (no ETA)
+            interval (float): Least seconds between two progress lines
+            label (str): What is being counted
+            initial (int): Items already done before this run, e.g. when resuming
+        """
+        self.total = total
+        self.initial = initial
+        self.interval = interval
+        self.label = label
+        self.started = time.monotonic()
+        self._printed = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, done, force=False):
+        """
+        Report how many items are done, printing a line if the interval has passed.
+
+        Args:
+            done (int): Items finished so far
+            force (bool): Print even if a line was printed recently
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._printed < self.interval:
+                return
+            self._printed = now
+
+        elapsed = now - self.started
+        rate = (done - self.initial) / elapsed if elapsed > 0 else 0.0
+        line = f"Processed {done}/{self.total or '?'} {self.label} ({rate:.1f}/s"
+
+        if self.total and rate > 0:
+            remaining = max(0, self.total - done) / rate
+            line += f", ETA {int(remaining // 3600)}:{int(remaining % 3600 // 60):02d}:{int(remaining % 60):02d}"
+
+        print(line + ")")
+
+def get_metrics():
+    """
+    Get the metrics shared by every module of the run, creating them on first use.
+
+    Returns:
+        Metrics: Shared metrics
+    """
+    global _metrics
+
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+
+    return _metrics
+
+def finish_run(metrics_file=None):
+    """
+    Print where the run's time went and save the metrics if asked to.
+
+    Args:
+        metrics_file (str): Path to save the metrics to (.prom for Prometheus text, JSON otherwise)
+    """
+    metrics = get_metrics()
+    print(metrics.summary())
+
+    if metrics_file:
+        metrics.write(metrics_file)
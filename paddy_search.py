@@ -0,0 +1,234 @@
+from bs4 import BeautifulSoup
+import urllib.parse
+import re
+from collections import namedtuple
+
+# Base search URL for the Paddy Pallin website
+SEARCH_URL_TEMPLATE = "https://www.paddypallin.com.au/nsearch?q={query}"
+
+# Headers sent with every search request, with a user agent to avoid potential blocking
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Text shown inside the no results container when a search comes back empty
+NO_RESULTS_TEXT = "did not match any products"
+
+def build_search_url(search_string):
+    """
+    Build the Paddy Pallin search URL for a SKU or product.
+
+    Args:
+        search_string (str): SKU or product to search
+
+    Returns:
+        str: Search URL with the search string encoded
+    """
+    # Encode the search string for URL
+    encoded_search = urllib.parse.quote(search_string)
+
+    return SEARCH_URL_TEMPLATE.format(query=encoded_search)
+
+# Outcomes of classifying a search results page
+FOUND = 'found'
+NOT_FOUND = 'not_found'
+
+# Outcome of a check that gave no answer (timeout, HTTP error, inconclusive page)
+UNKNOWN = 'unknown'
+
+# HTTP status codes worth retrying, the rest are treated as definitive failures
+TRANSIENT_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+# Result of checking one SKU.
+# reason says why the status is UNKNOWN, product_count is None when the
+# engine doesn't count products, and transient is True when trying again
+# could still give an answer.
+SearchOutcome = namedtuple('SearchOutcome', ['status', 'reason', 'product_count', 'transient'], defaults=(None, None, False))
+
+def unknown(reason, transient=True):
+    """
+    Build the outcome of a check that gave no answer.
+
+    Args:
+        reason (str): Why the check failed, written to the Error column
+        transient (bool): Whether retrying could still give an answer
+
+    Returns:
+        SearchOutcome: UNKNOWN outcome
+    """
+    return SearchOutcome(UNKNOWN, reason=reason, transient=transient)
+
+def http_error(status_code):
+    """
+    Build the outcome of a search page that came back with an HTTP error.
+
+    Args:
+        status_code (int): HTTP status code
+
+    Returns:
+        SearchOutcome: UNKNOWN outcome, transient for 429s, timeouts and server errors
+    """
+    return unknown(f"HTTP {status_code}", transient=status_code in TRANSIENT_STATUS_CODES)
+
+def status_flag(outcome, status):
+    """
+    Turn an outcome into the True/False/blank value of an output column.
+
+    Args:
+        outcome (SearchOutcome): Outcome of the check
+        status (str): Status the column flags, FOUND or NOT_FOUND
+
+    Returns:
+        bool: Whether the outcome has that status, None if it is UNKNOWN
+    """
+    if outcome.status == UNKNOWN:
+        return None
+
+    return outcome.status == status
+
+# Markers the streaming classifier looks for in the raw page bytes
+PRODUCT_LIST_MARKER = b'amasty-shopby-product-list'
+PRODUCT_ITEM_MARKER = b'product-item'
+NO_RESULTS_MARKER = b'nxt-nrf'
+_MARKERS = [PRODUCT_LIST_MARKER, PRODUCT_ITEM_MARKER, NO_RESULTS_MARKER, NO_RESULTS_TEXT.encode()]
+_MARKER_PATTERN = re.compile(b'|'.join(re.escape(marker) for marker in _MARKERS))
+
+class SearchPageScanner:
+    """
+    Classifies a search results page from its raw bytes as they arrive.
+
+    feed() is called with each chunk of the response body and returns as soon
+    as a definitive marker has been seen, so the rest of the page never needs
+    to be downloaded or parsed:
+    - a product-item after the amasty-shopby-product-list container: FOUND
+    - the no results text after the nxt-nrf container: NOT_FOUND
+    """
+
+    def __init__(self):
+        self.status = None
+        self._in_product_list = False
+        self._in_no_results = False
+        self._tail = b''
+
+        # Enough bytes to catch a marker split across two chunks
+        self._overlap = max(len(marker) for marker in _MARKERS) - 1
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the page.
+
+        Args:
+            chunk (bytes or str): Next part of the response body
+
+        Returns:
+            str: FOUND or NOT_FOUND once decided, None while still undecided
+        """
+        if self.status is not None:
+            return self.status
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+
+        buffer = self._tail + chunk
+        scanned_to = 0
+
+        for match in _MARKER_PATTERN.finditer(buffer):
+            marker = match.group()
+            scanned_to = match.end()
+
+            if marker == PRODUCT_LIST_MARKER:
+                self._in_product_list = True
+            elif marker == NO_RESULTS_MARKER:
+                self._in_no_results = True
+            elif marker == PRODUCT_ITEM_MARKER and self._in_product_list:
+                self.status = FOUND
+                return self.status
+            elif marker != PRODUCT_ITEM_MARKER and self._in_no_results:
+                self.status = NOT_FOUND
+                return self.status
+
+        # Keep the end of the buffer that could hold the start of a marker, but
+        # not any part of a marker that was already counted
+        self._tail = buffer[max(scanned_to, len(buffer) - self._overlap):]
+
+        return None
+
+def classify_chunks(chunks):
+    """
+    Classify a search results page, stopping at the first definitive marker.
+
+    Args:
+        chunks (iterable): Parts of the response body (bytes or str)
+
+    Returns:
+        str: FOUND or NOT_FOUND, None if the page had neither marker
+    """
+    scanner = SearchPageScanner()
+    for chunk in chunks:
+        status = scanner.feed(chunk)
+        if status is not None:
+            return status
+
+    return None
+
+def classify_search_page(html):
+    """
+    Classify a search results page from its raw HTML.
+
+    Args:
+        html (str): HTML content of the search results page
+
+    Returns:
+        tuple: (FOUND, NOT_FOUND or None if the page is inconclusive, number of products listed)
+    """
+    # Parse the HTML
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Look for product items in the product list container
+    product_list = soup.find(id='amasty-shopby-product-list')
+    if product_list:
+        product_items = product_list.find_all(class_='product-item')
+        if product_items:
+            return FOUND, len(product_items)
+
+    # Look for the no results div
+    no_results_div = soup.find('div', class_='nxt-nrf-container')
+    if no_results_div and NO_RESULTS_TEXT in no_results_div.get_text():
+        return NOT_FOUND, 0
+
+    # Neither marker was served in the HTML, a browser is needed to decide
+    return None, 0
+
+def normalize_sku(sku):
+    """
+    Canonicalize a SKU so the same code always maps to the same key.
+
+    Numeric codes that went through a float column (50931406.0) get their
+    integer form back, whitespace is stripped and letters are upper-cased.
+
+    Args:
+        sku: SKU as read from the input file
+
+    Returns:
+        str: Normalized SKU, or None if the cell is blank
+    """
+    if sku is None:
+        return None
+
+    if isinstance(sku, float):
+        # NaN from an empty cell
+        if sku != sku:
+            return None
+        if sku.is_integer():
+            sku = int(sku)
+
+    sku = str(sku).strip().upper()
+
+    # Codes that were saved as text after going through a float column
+    if re.fullmatch(r'\d+\.0+', sku):
+        sku = sku.split('.')[0]
+
+    if sku in ('', 'NAN', 'NONE'):
+        return None
+
+    return sku
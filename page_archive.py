@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import importlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from paddy_search import normalize_sku
+
+# Default folder of the archive
+DEFAULT_ARCHIVE_DIR = 'page_archive'
+
+# zlib level pages are compressed at, search pages shrink about tenfold
+COMPRESSION_LEVEL = 6
+
+# One archived fetch of a search page
+ArchivedPage = namedtuple('ArchivedPage', ['sku', 'fetched_at', 'digest', 'url', 'status_code', 'engine'])
+
+_archive = None
+_archive_lock = threading.Lock()
+
+class PageArchive:
+    """
+    Compressed, content-addressed store of fetched search pages.
+
+    Page bodies are zlib-compressed and appended once to a single pack file,
+    keyed by the SHA-256 of the raw page, so a page fetched many times is
+    stored once. A SQLite index records each fetch by SKU and time, and
+    where its body sits in the pack. The pack is read through a memory map,
+    so re-reading the archive costs little more than decompressing it.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_ARCHIVE_DIR):
+        """
+        Open (or create) the archive.
+
+        Args:
+            path (str): Folder holding the pack file and its index
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pack = open(os.path.join(path, 'pages.pack'), 'ab')
+        self._view = None
+        self._conn = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " digest TEXT PRIMARY KEY,"
+                " offset INTEGER NOT NULL,"
+                " length INTEGER NOT NULL,"
+                " size INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " sku TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " digest TEXT NOT NULL REFERENCES blobs(digest),"
+                " url TEXT,"
+                " status_code INTEGER,"
+                " engine TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS pages_sku ON pages (sku, fetched_at)")
+
+    def put(self, sku, body, url=None, status_code=None, engine=None):
+        """
+        Archive a fetched page.
+
+        Args:
+            sku: SKU the page was searched for
+            body (bytes or str): Page body as fetched
+            url (str): URL the page was fetched from
+            status_code (int): HTTP status of the response, if known
+            engine (str): Name of the engine that fetched it
+
+        Returns:
+            str: SHA-256 digest the body is stored under
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        digest = hashlib.sha256(body).hexdigest()
+
+        with self._lock, self._conn:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+
+            if known is None:
+                compressed = zlib.compress(body, COMPRESSION_LEVEL)
+                offset = self._pack.tell()
+                self._pack.write(compressed)
+                self._pack.flush()
+                self._conn.execute(
+                    "INSERT INTO blobs (digest, offset, length, size) VALUES (?, ?, ?, ?)",
+                    (digest, offset, len(compressed), len(body))
+                )
+
+            self._conn.execute(
+                "INSERT INTO pages (sku, fetched_at, digest, url, status_code, engine) VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_sku(sku), time.time(), digest, url, status_code, engine)
+            )
+
+        return digest
+
+    def _read(self, offset, length):
+        # Map the pack again once it has grown past the current mapping
+        with self._lock:
+            if self._view is None or offset + length > len(self._view):
+                if self._view is not None:
+                    self._view.close()
+                with open(os.path.join(self.path, 'pages.pack'), 'rb') as f:
+                    self._view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = self._view
+
+        return zlib.decompress(view[offset:offset + length])
+
+    def read_blob(self, digest):
+        """
+        Read a page body by its digest.
+
+        Args:
+            digest (str): SHA-256 digest of the body
+
+        Returns:
+            bytes: The page body, or None if it isn't archived
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT offset, length FROM blobs WHERE digest = ?", (digest,)).fetchone()
+
+        return self._read(*row) if row is not None else None
+
+    def latest(self, sku):
+        """
+        Get the most recent fetch of a SKU's search page.
+
+        Args:
+            sku: SKU to look up
+
+        Returns:
+            ArchivedPage: The latest fetch, or None if the SKU was never archived
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sku, fetched_at, digest, url, status_code, engine FROM pages"
+                " WHERE sku = ? ORDER BY fetched_at DESC LIMIT 1",
+                (normalize_sku(sku),)
+            ).fetchone()
+
+        return ArchivedPage(*row) if row is not None else None
+
+    def get(self, sku, default=None):
+        """
+        Get the HTML of a SKU's most recently fetched search page.
+
+        Works like dict.get, so the archive can stand in for a dict of pages keyed by SKU.
+
+        Args:
+            sku: SKU to look up
+            default: Returned if the SKU was never archived
+
+        Returns:
+            str: Page HTML
+        """
+        page = self.latest(sku)
+        if page is None:
+            return default
+
+        return self.read_blob(page.digest).decode('utf-8', errors='replace')
+
+    def __contains__(self, sku):
+        return self.latest(sku) is not None
+
+    def iter_latest(self):
+        """
+        Stream the latest fetch of every archived SKU, in pack order so the disk is read sequentially.
+
+        Yields:
+            tuple: (ArchivedPage, page HTML)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.sku, p.fetched_at, p.digest, p.url, p.status_code, p.engine, b.offset, b.length"
+                " FROM pages p JOIN blobs b ON b.digest = p.digest"
+                " WHERE p.fetched_at = (SELECT MAX(fetched_at) FROM pages WHERE sku = p.sku)"
+                " GROUP BY p.sku ORDER BY b.offset"
+            ).fetchall()
+
+        for *page, offset, length in rows:
+            yield ArchivedPage(*page), self._read(offset, length).decode('utf-8', errors='replace')
+
+    def close(self):
+        """
+        Close the pack file, its mapping and the index.
+        """
+        with self._lock:
+            self._pack.close()
+            if self._view is not None:
+                self._view.close()
+            self._conn.close()
+
+def configure_archive(path=DEFAULT_ARCHIVE_DIR):
+    """
+    Start archiving every search page the engines fetch.
+
+    Args:
+        path (str): Folder of the archive, None to stop archiving
+
+    Returns:
+        PageArchive: The archive, or None if archiving was turned off
+    """
+    global _archive
+
+    with _archive_lock:
+        old_archive = _archive
+        _archive = PageArchive(path) if path else None
+
+    if old_archive is not None:
+        old_archive.close()
+
+    return _archive
+
+def get_archive():
+    """
+    Get the archive fetched pages are written to.
+
+    Returns:
+        PageArchive: The archive, or None if archiving is off
+    """
+    return _archive
+
+def load_classifier(spec):
+    """
+    Import a classifier given as "module:function".
+
+    Args:
+        spec (str): e.g. "attempt2:check_if_product_not_found"
+
+    Returns:
+        callable: The classifier, called with (html, sku)
+    """
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise ValueError(f"Classifier must look like module:function, got '{spec}'")
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+def reclassify(archive, classifier):
+    """
+    Run a classifier over the latest archived page of every SKU, without fetching anything.
+
+    Args:
+        archive (PageArchive): Archive to read
+        classifier (callable): Called with (html, sku), e.g. attempt2.check_if_product_not_found
+
+    Yields:
+        dict: Result row with the SKU, when its page was fetched and the classifier's result
+    """
+    for page, html in archive.iter_latest():
+        yield {
+            'Item Code': page.sku,
+            'Fetched At': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(page.fetched_at)),
+            'Result': classifier(html, page.sku),
+        }
+
+# Example usage
+if __name__ == "__main__":
+    from result_sink import write_results
+
+    parser = argparse.ArgumentParser(description="Re-run a page classifier over archived search pages")
+    parser.add_argument('output_file', help="Results file (.xlsx, .csv or .parquet)")
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_DIR, help="Archive folder")
+    parser.add_argument('--classifier', default='attempt2:check_if_product_not_found',
+                        help="Classifier to run, as module:function taking (html, sku)")
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    try:
+        started = time.monotonic()
+        count = write_results(args.output_file, reclassify(archive, load_classifier(args.classifier)),
+                              ['Item Code', 'Fetched At', 'Result'])
+        elapsed = time.monotonic() - started
+        print(f"Re-classified {count} pages in {elapsed:.1f}s, results saved to {args.output_file}")
+    finally:
+        archive.close()
@@ -0,0 +1,262 @@
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import requests
+from paddy_search import build_search_url, classify_search_page, SearchOutcome, unknown, http_error
+from http_session import throttled_get
+from retry import backoff_delay, DEFAULT_ATTEMPTS, DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY
+from metrics import get_metrics
+from page_archive import get_archive
+
+# Threads fetching search pages at once
+DEFAULT_FETCH_WORKERS = 20
+
+# Processes parsing fetched pages at once
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+
+# Items each queue between two stages holds before the stage feeding it waits
+DEFAULT_QUEUE_SIZE = 100
+
+# Put on a queue by a stage that has nothing more to send
+_DONE = object()
+
+def fetch_search_page(search_string, timeout=10):
+    """
+    Fetch a SKU's search page in full, without classifying it.
+
+    Args:
+        search_string (str): SKU or product to search
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        tuple: (page body, None) once fetched, or (None, UNKNOWN SearchOutcome)
+            with the reason if the request failed
+    """
+    # Construct the search URL
+    url = build_search_url(search_string)
+
+    try:
+        response = throttled_get(url, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Request error for {search_string}: {e}")
+        return None, unknown(str(e))
+
+    # Keep the page for re-classifying later, if archiving is on
+    archive = get_archive()
+    if archive is not None:
+        archive.put(search_string, response.content, url=url, status_code=response.status_code, engine='pipeline')
+
+    if response.status_code != 200:
+        print(f"Error fetching URL for {search_string}: HTTP {response.status_code}")
+        return None, http_error(response.status_code)
+
+    return response.content, None
+
+def parse_search_page(body, inconclusive=None):
+    """
+    Classify a fetched search page. Runs in a parser process, so it must stay picklable.
+
+    Args:
+        body (bytes): Page body
+        inconclusive (str): Status given to a page with neither marker,
+            e.g. FOUND for scripts that treat anything but the no results
+            message as found. None reports it as UNKNOWN
+
+    Returns:
+        SearchOutcome: FOUND with the number of products listed, NOT_FOUND or UNKNOWN
+    """
+    status, product_count = classify_search_page(body)
+
+    if status is None:
+        if inconclusive is None:
+            return unknown("Search page inconclusive without a browser", transient=False)
+        status = inconclusive
+
+    return SearchOutcome(status, product_count=product_count)
+
+def _timed_parse(parse, body):
+    # The parser process has its own metrics, so the time is sent back with the outcome
+    started = time.perf_counter()
+    outcome = parse(body)
+    return outcome, time.perf_counter() - started
+
+class Pipeline:
+    """
+    Checks SKUs in stages connected by bounded queues: source, fetch, parse, sink.
+
+    - source: reads the SKUs (already normalized, with cache hits left out)
+    - fetch: a pool of threads downloading search pages, retrying transient
+      failures with backoff
+    - parse: a pool of processes classifying the pages, so parsing isn't
+      held back by the GIL the fetch threads share
+    - sink: the calling thread, which gets every outcome through on_result
+
+    A full queue makes the stage feeding it wait, so a slow parser or sink
+    holds back fetching instead of piling pages up in memory. The number of
+    fetch threads and parser processes are set separately, to scale network
+    concurrency and parse throughput each on their own.
+    """
+
+    def __init__(self, on_result, parse=parse_search_page, fetch=fetch_search_page,
+                 fetch_workers=DEFAULT_FETCH_WORKERS, parse_workers=DEFAULT_PARSE_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, attempts=DEFAULT_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Args:
+            on_result (callable): Called with (sku, SearchOutcome) for each SKU,
+                always from the thread that runs the pipeline
+            parse (callable): Top-level function (or partial of one) taking a
+                page body and returning a SearchOutcome, run in the parser processes
+            fetch (callable): Takes a SKU and returns (page body, None) or
+                (None, UNKNOWN SearchOutcome), see fetch_search_page
+            fetch_workers (int): Threads fetching pages
+            parse_workers (int): Processes parsing pages
+            queue_size (int): Capacity of each queue between two stages
+            attempts (int): Most fetches per SKU
+            base_delay (float): Backoff cap after the first failed fetch
+            max_delay (float): Largest backoff cap
+        """
+        self.on_result = on_result
+        self.parse = parse
+        self.fetch = fetch
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _fetch_with_retries(self, sku):
+        # Same backoff as retry.with_retries; only fetching can fail transiently
+        attempt = 1
+        while True:
+            body, outcome = self.fetch(sku)
+
+            if outcome is None or not outcome.transient:
+                return body, outcome
+
+            if attempt >= self.attempts:
+                return None, outcome._replace(reason=f"{outcome.reason} (after {attempt} attempts)")
+
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            print(f"Retrying {sku} in {delay:.1f}s: {outcome.reason}")
+            get_metrics().inc('retries_total')
+            time.sleep(delay)
+            attempt += 1
+
+    def _source(self, skus, fetch_queue):
+        try:
+            for sku in skus:
+                fetch_queue.put(sku)
+        except Exception as e:
+            # Raised again by the sink once the SKUs already sent are done
+            self._error = e
+        finally:
+            for _ in range(self.fetch_workers):
+                fetch_queue.put(_DONE)
+
+    def _fetcher(self, fetch_queue, parse_queue, results):
+        while True:
+            sku = fetch_queue.get()
+            if sku is _DONE:
+                break
+
+            started = time.perf_counter()
+            try:
+                body, outcome = self._fetch_with_retries(sku)
+            except Exception as e:
+                print(f"Unexpected error fetching {sku}: {e}")
+                body, outcome = None, unknown(str(e), transient=False)
+
+            if outcome is not None:
+                results.put((sku, outcome, started))
+            else:
+                parse_queue.put((sku, body, started))
+
+        parse_queue.put(_DONE)
+
+    def _dispatcher(self, parse_queue, results, executor):
+        # Pages waiting in the parser processes, on top of those in the parse queue
+        slots = threading.BoundedSemaphore(self.parse_workers * 2)
+
+        def on_parsed(future, sku, started):
+            try:
+                outcome, seconds = future.result()
+                get_metrics().observe('parse', seconds)
+            except Exception as e:
+                print(f"Unexpected error parsing {sku}: {e}")
+                outcome = unknown(str(e), transient=False)
+
+            results.put((sku, outcome, started))
+            slots.release()
+
+        remaining = self.fetch_workers
+        while remaining:
+            item = parse_queue.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+
+            sku, body, started = item
+            slots.acquire()
+            future = executor.submit(_timed_parse, self.parse, body)
+            future.add_done_callback(lambda future, sku=sku, started=started: on_parsed(future, sku, started))
+
+        # Wait for the last parses to come back before closing the results
+        for _ in range(self.parse_workers * 2):
+            slots.acquire()
+        results.put(_DONE)
+
+    def run(self, skus):
+        """
+        Check every SKU, calling on_result as each one finishes.
+
+        Args:
+            skus (iterable): Normalized SKUs, read lazily as the fetchers keep up
+        """
+        metrics = get_metrics()
+        self._error = None
+
+        fetch_queue = queue.Queue(self.queue_size)
+        parse_queue = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+
+        # Parser processes are spawned rather than forked, the fetch threads are already running
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.parse_workers, mp_context=multiprocessing.get_context('spawn')
+        )
+
+        threads = [threading.Thread(target=self._source, args=(skus, fetch_queue), daemon=True)]
+        threads += [
+            threading.Thread(target=self._fetcher, args=(fetch_queue, parse_queue, results), daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        threads.append(threading.Thread(target=self._dispatcher, args=(parse_queue, results, executor), daemon=True))
+
+        try:
+            for thread in threads:
+                thread.start()
+
+            # Sink: hand every outcome over in this thread
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+
+                sku, outcome, started = item
+                metrics.observe('check', time.perf_counter() - started)
+                metrics.inc('checks_total', status=outcome.status)
+
+                self.on_result(sku, outcome)
+
+            for thread in threads:
+                thread.join()
+
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if self._error is not None:
+            raise self._error
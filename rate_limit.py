@@ -0,0 +1,237 @@
+import asyncio
+import email.utils
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from metrics import get_metrics
+
+# Starting request rate per host, the old fixed delay was 1 request a second
+DEFAULT_RATE = 1.0
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 20.0
+
+# Responses slower than this (seconds) count as a sign the site is struggling
+DEFAULT_SLOW_RESPONSE = 3.0
+
+# Status codes that mean the site wants us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header.
+
+    Args:
+        value (str): Header value, either delay-seconds or an HTTP date
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def is_timeout(error):
+    """
+    Check if an exception is a timeout, from requests, aiohttp, Selenium or the standard library.
+
+    Args:
+        error (Exception): Exception raised by a fetch
+
+    Returns:
+        bool: True for timeouts
+    """
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or 'Timeout' in type(error).__name__
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket for one host whose rate adapts to how the host responds.
+
+    The rate creeps up while responses are fast and healthy, is cut on
+    429/503 responses and timeouts, and a Retry-After header pauses all
+    requests to the host until it has passed. Safe to share between threads
+    and between the tasks of an event loop.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 increase=0.05, decrease=0.5, slow_response=DEFAULT_SLOW_RESPONSE):
+        """
+        Args:
+            rate (float): Starting requests per second
+            min_rate (float): Lowest rate backing off can reach
+            max_rate (float): Highest rate ramping up can reach
+            increase (float): Requests per second added after each healthy response
+            decrease (float): Factor the rate is multiplied by when throttled
+            slow_response (float): Seconds after which a response counts as slow
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_response = slow_response
+
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Take a token if one is free, otherwise return how long to wait for one
+        with self._lock:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            # Refill, allowing a burst of at most one second's worth of requests
+            self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until a request may be sent.
+        """
+        started = time.perf_counter()
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                get_metrics().observe('queue_wait', time.perf_counter() - started)
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Wait on the event loop until a request may be sent.
+        """
+        started = time.perf_counter()
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                get_metrics().observe('queue_wait', time.perf_counter() - started)
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self, latency):
+        """
+        Record a healthy response.
+
+        Args:
+            latency (float): Seconds the response took
+        """
+        with self._lock:
+            if latency > self.slow_response:
+                # Slow but successful, ease off a little
+                self.rate = max(self.min_rate, self.rate * 0.9)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """
+        Record a 429/503 response or a timeout.
+
+        Args:
+            retry_after (float): Seconds the host asked us to wait, if it said
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = 0.0
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+        print(f"Throttled, slowing down to {self.rate:.2f} requests/s"
+              + (f" after a {retry_after:.0f}s pause" if retry_after else ""))
+
+    def on_response(self, status_code, retry_after_header=None, latency=0.0):
+        """
+        Record a response by its HTTP status.
+
+        Args:
+            status_code (int): HTTP status code
+            retry_after_header (str): Value of the Retry-After header, if any
+            latency (float): Seconds the response took
+        """
+        if status_code in THROTTLE_STATUS_CODES:
+            self.on_throttle(parse_retry_after(retry_after_header))
+        elif status_code < 500:
+            self.on_success(latency)
+
+    @contextmanager
+    def throttled(self):
+        """
+        Wait for a slot, then time the fetch in the with block.
+
+        Timeouts raised in the block back the rate off; anything else that
+        completes counts as a healthy response. Use on_response() instead
+        when the HTTP status is available.
+
+        Yields:
+            AdaptiveRateLimiter: This limiter
+        """
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield self
+        except Exception as e:
+            if is_timeout(e):
+                self.on_throttle()
+            raise
+        else:
+            self.on_success(time.monotonic() - started)
+
+def get_limiter(url):
+    """
+    Get the shared rate limiter for a URL's host, creating it on first use.
+
+    Args:
+        url (str): URL (or bare host name) about to be fetched
+
+    Returns:
+        AdaptiveRateLimiter: Limiter shared by every request to that host
+    """
+    host = urllib.parse.urlsplit(url).netloc or url
+
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = AdaptiveRateLimiter()
+
+    return limiter
+
+def configure_limiter(url, **kwargs):
+    """
+    Replace the rate limiter for a URL's host, e.g. to change its starting or maximum rate.
+
+    Args:
+        url (str): URL (or bare host name)
+        **kwargs: AdaptiveRateLimiter arguments
+
+    Returns:
+        AdaptiveRateLimiter: The new limiter
+    """
+    host = urllib.parse.urlsplit(url).netloc or url
+
+    with _limiters_lock:
+        limiter = _limiters[host] = AdaptiveRateLimiter(**kwargs)
+
+    return limiter
@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from paddy_search import FOUND, normalize_sku
+from metrics import get_metrics
+
+# Default location of the cache database
+DEFAULT_CACHE_FILE = 'sku_cache.sqlite'
+
+# How long a cached answer is served before the SKU is checked again
+DEFAULT_POSITIVE_TTL = 7 * 24 * 60 * 60  # Product found: 7 days
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60  # No results: 1 day
+
+# Engines that only cache an answer they saw a product list or no results message for.
+# at3 and at3_async report any page without the no results message as found
+DEFINITIVE_ENGINES = ('http', 'selenium', 'browser_fetch')
+
+# A cached classification, with when and how it was produced
+CachedResult = namedtuple('CachedResult', ['status', 'product_count', 'checked_at', 'engine'])
+
+class ResultCache:
+    """
+    On-disk cache of SKU classifications, so reruns skip recently checked SKUs.
+
+    Entries are keyed by normalized SKU and record the classification, when
+    it was checked and which engine produced it. Found and not found answers
+    expire after separate TTLs. A script can limit which engines it takes
+    answers from, so a guess cached by a looser engine isn't served where
+    only a definitive answer will do. One connection is shared behind a lock, so the
+    cache can be used from worker threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, positive_ttl=DEFAULT_POSITIVE_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 engines=None):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Path to the SQLite database file
+            positive_ttl (float): Seconds a found answer stays valid
+            negative_ttl (float): Seconds a not found answer stays valid
+            engines (iterable): Only serve answers produced by these engines, None serves any
+        """
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.engines = frozenset(engines) if engines is not None else None
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            # WAL lets other processes read the cache while this one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " sku TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " product_count INTEGER,"
+                " checked_at REAL NOT NULL,"
+                " engine TEXT NOT NULL)"
+            )
+
+    def lookup(self, sku):
+        """
+        Look up a SKU's cached result.
+
+        Args:
+            sku: SKU to look up
+
+        Returns:
+            CachedResult: The cached result, or None if missing, expired or from an engine not served
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, product_count, checked_at, engine FROM results WHERE sku = ?",
+                (normalize_sku(sku),)
+            ).fetchone()
+
+            if row is not None and (self.engines is None or row[3] in self.engines):
+                result = CachedResult(*row)
+                ttl = self.positive_ttl if result.status == FOUND else self.negative_ttl
+                if time.time() - result.checked_at < ttl:
+                    self.hits += 1
+                    get_metrics().inc('cache_hits_total')
+                    return result
+
+            self.misses += 1
+            get_metrics().inc('cache_misses_total')
+            return None
+
+    def get(self, sku):
+        """
+        Look up a SKU's cached classification.
+
+        Args:
+            sku: SKU to look up
+
+        Returns:
+            str: FOUND or NOT_FOUND, or None if missing, expired or from an engine not served
+        """
+        result = self.lookup(sku)
+        return result.status if result is not None else None
+
+    def put(self, sku, status, engine, product_count=None):
+        """
+        Record a SKU's classification.
+
+        Args:
+            sku: SKU that was checked
+            status (str): FOUND or NOT_FOUND
+            engine (str): Name of the engine that produced the answer
+            product_count (int): Number of products listed, if the engine counts them
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (sku, status, product_count, checked_at, engine)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (normalize_sku(sku), status, product_count, time.time(), engine)
+            )
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._conn.close()
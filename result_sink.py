@@ -0,0 +1,284 @@
+import csv
+import os
+from paddy_search import normalize_sku
+
+# Number of rows buffered per Parquet row group
+DEFAULT_PARQUET_BATCH_SIZE = 10000
+
+class ResultSink:
+    """
+    Writes result rows to an xlsx, CSV or Parquet file as they arrive.
+
+    The format is picked from the file extension. Rows are dicts and are
+    written in a fixed column layout; keys missing from a row are left blank.
+    xlsx files are written in openpyxl's write-only mode, so no rows are
+    kept in memory and there is no formatting pass.
+
+    Parquet column types are taken from the first batch of rows. A column
+    that a later row doesn't fit (text after numbers, a float after ints)
+    is widened to text, rewriting the row groups already written.
+    """
+
+    def __init__(self, path, columns, batch_size=DEFAULT_PARQUET_BATCH_SIZE, text_columns=()):
+        """
+        Create the output file.
+
+        Args:
+            path (str): Path to an .xlsx, .csv or .parquet file
+            columns (list): Column names, in output order
+            batch_size (int): Rows per Parquet row group
+            text_columns (iterable): Columns always written as text in Parquet,
+                e.g. input columns passed through whose type can change further down
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.format = os.path.splitext(path)[1].lower().lstrip('.')
+        self.count = 0
+
+        if self.format == 'csv':
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+
+        elif self.format == 'parquet':
+            self.batch_size = batch_size
+            self._batch = []
+            self._text_columns = set(text_columns)
+            self._schema = None
+            self._writer = None
+
+        elif self.format in ('xlsx', 'xlsm'):
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet()
+            self._sheet.append(self.columns)
+
+        else:
+            raise ValueError(f"Unsupported output file type: {path}")
+
+    def write(self, row):
+        """
+        Append one result row.
+
+        Args:
+            row (dict): Values keyed by column name
+        """
+        self.write_values([row.get(column) for column in self.columns])
+
+    def write_values(self, values):
+        """
+        Append one row given as values already in column order.
+
+        Args:
+            values (list): One value per column
+        """
+        if self.format == 'csv':
+            self._writer.writerow(['' if value is None else value for value in values])
+
+        elif self.format == 'parquet':
+            self._batch.append(values)
+            if len(self._batch) >= self.batch_size:
+                self._write_parquet_batch()
+
+        else:
+            # openpyxl can't store NaN, leave the cell blank like to_excel does
+            self._sheet.append([None if value != value else value for value in values])
+
+        self.count += 1
+
+    def write_all(self, rows):
+        """
+        Append every row from an iterable.
+
+        Args:
+            rows (iterable): Result rows
+        """
+        for row in rows:
+            self.write(row)
+
+    def _parquet_schema(self):
+        import pyarrow as pa
+
+        # Give each column the narrowest type that fits the first batch, string otherwise
+        fields = []
+        for i, column in enumerate(self.columns):
+            kinds = {type(values[i]) for values in self._batch if values[i] is not None}
+            if column in self._text_columns:
+                field_type = pa.string()
+            elif kinds == {bool}:
+                field_type = pa.bool_()
+            elif kinds == {int}:
+                field_type = pa.int64()
+            elif kinds and kinds <= {int, float}:
+                field_type = pa.float64()
+            else:
+                field_type = pa.string()
+            fields.append(pa.field(str(column), field_type))
+
+        return pa.schema(fields)
+
+    def _write_parquet_batch(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._batch:
+            return
+
+        if self._writer is None:
+            self._schema = self._parquet_schema()
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+
+        arrays = []
+        misfits = []
+        for i, field in enumerate(self._schema):
+            values = [values[i] for values in self._batch]
+            if pa.types.is_string(field.type):
+                arrays.append(_text_array(values))
+                continue
+
+            if not _fits(field.type, values):
+                misfits.append(i)
+                continue
+
+            arrays.append(pa.array(values, type=field.type))
+
+        if misfits:
+            self._widen_to_text(misfits)
+            return self._write_parquet_batch()
+
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._batch = []
+
+    def _widen_to_text(self, indexes):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        names = [self._schema[i].name for i in indexes]
+        print(f"Writing {', '.join(names)} as text: later rows don't fit the type of the first ones")
+
+        # The file's schema is fixed once written, so the rows so far are read back and written again
+        self._writer.close()
+        written = pq.read_table(self.path)
+
+        fields = list(self._schema)
+        for i in indexes:
+            fields[i] = pa.field(fields[i].name, pa.string())
+        self._schema = pa.schema(fields)
+
+        arrays = [
+            _text_array(written.column(i).to_pylist()) if i in indexes else written.column(i)
+            for i in range(len(fields))
+        ]
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        """
+        Finish writing and close the file.
+        """
+        if self.format == 'csv':
+            self._file.close()
+
+        elif self.format == 'parquet':
+            self._write_parquet_batch()
+            if self._writer is None:
+                # No rows at all, still write a file with the columns
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                pq.write_table(pa.table({str(column): pa.array([], type=pa.string()) for column in self.columns}), self.path)
+            else:
+                self._writer.close()
+
+        else:
+            self._workbook.save(self.path)
+
+def _fits(field_type, values):
+    import pyarrow as pa
+
+    # The same kinds _parquet_schema picks each type for; pyarrow would quietly truncate 9.5 into an int column
+    kinds = {type(value) for value in values if value is not None}
+    if pa.types.is_boolean(field_type):
+        return kinds <= {bool}
+    if pa.types.is_integer(field_type):
+        return kinds <= {int}
+    return kinds <= {int, float}
+
+def _text_array(values):
+    import pyarrow as pa
+
+    return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+def write_results(path, rows, columns):
+    """
+    Stream result rows into an output file.
+
+    Args:
+        path (str): Path to an .xlsx, .csv or .parquet file
+        rows (iterable): Result rows (dicts keyed by column name)
+        columns (list): Column names, in output order
+
+    Returns:
+        int: Number of rows written
+    """
+    sink = ResultSink(path, columns)
+    try:
+        sink.write_all(rows)
+    finally:
+        sink.close()
+
+    return sink.count
+
+def write_joined(path, source, results, result_columns):
+    """
+    Stream the input rows into an output file with the result columns joined on by SKU.
+
+    The input is read a second time instead of being kept in memory, so only
+    the compact results are held while the checks run.
+
+    Args:
+        path (str): Path to an .xlsx, .csv or .parquet file
+        source (RowSource): The input rows
+        results (dict): Results keyed by SKU, each a dict keyed by result column
+        result_columns (list): Result column names, added after the input columns
+
+    Returns:
+        int: Number of rows written
+    """
+    sink = None
+    try:
+        for _, row in source:
+            # The input columns are only known once the header has been read
+            if sink is None:
+                # Input columns are passed through as text, their type can change further down the file
+                sink = ResultSink(path, source.columns + result_columns, text_columns=source.columns)
+
+            result = results.get(normalize_sku(row[source.sku_column]), {})
+            # Picked by name, a ragged CSV row keeps its extra cells under a None key
+            values = [row.get(column) for column in source.columns]
+            sink.write_values(values + [result.get(column) for column in result_columns])
+
+        if sink is None:
+            # No data rows, still write the header
+            sink = ResultSink(path, (source.columns or [source.sku_column]) + result_columns)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    return sink.count
+
+def write_fanned_out(path, source, results, columns, sku_column):
+    """
+    Write one result row per input row, in input order, from results checked once per SKU.
+
+    Args:
+        path (str): Path to an .xlsx, .csv or .parquet file
+        source (RowSource): The input rows
+        results (dict): Result rows keyed by normalized SKU
+        columns (list): Column names, in output order
+        sku_column (str): Output column holding the SKU
+
+    Returns:
+        int: Number of rows written
+    """
+    rows = (results.get(sku) or {sku_column: sku} for _, sku in source.skus())
+    return write_results(path, rows, columns)
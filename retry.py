@@ -0,0 +1,109 @@
+import asyncio
+import random
+import time
+from paddy_search import UNKNOWN
+from metrics import get_metrics
+
+# Checks per SKU before it is given up on as UNKNOWN
+DEFAULT_ATTEMPTS = 4
+
+# Backoff before the first retry, doubled for each one after it (seconds)
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+
+def backoff_delay(attempt, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Get how long to wait before retrying, with exponential backoff and full jitter.
+
+    The jitter spreads out retries of SKUs that failed together, so they
+    don't all hit the site again at the same moment.
+
+    Args:
+        attempt (int): Number of attempts made so far (1 after the first)
+        base_delay (float): Backoff cap after the first attempt
+        max_delay (float): Largest backoff cap
+
+    Returns:
+        float: Seconds to wait
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+def with_retries(check, search_string, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Check a SKU, retrying transient failures with jittered exponential backoff.
+
+    Args:
+        check (callable): Check taking the search string and returning a SearchOutcome
+        search_string (str): SKU or product to search
+        attempts (int): Most checks made for the SKU
+        base_delay (float): Backoff cap after the first attempt
+        max_delay (float): Largest backoff cap
+
+    Returns:
+        SearchOutcome: FOUND or NOT_FOUND, or UNKNOWN once the failure is
+            definitive or the attempt budget is spent
+    """
+    metrics = get_metrics()
+    started = time.perf_counter()
+
+    attempt = 1
+    while True:
+        outcome = check(search_string)
+
+        if outcome.status != UNKNOWN or not outcome.transient:
+            break
+
+        if attempt >= attempts:
+            outcome = outcome._replace(reason=f"{outcome.reason} (after {attempt} attempts)")
+            break
+
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        print(f"Retrying {search_string} in {delay:.1f}s: {outcome.reason}")
+        metrics.inc('retries_total')
+        time.sleep(delay)
+        attempt += 1
+
+    metrics.observe('check', time.perf_counter() - started)
+    metrics.inc('checks_total', status=outcome.status)
+
+    return outcome
+
+async def with_retries_async(check, search_string, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Check a SKU on the event loop, retrying transient failures with jittered exponential backoff.
+
+    Args:
+        check (callable): Coroutine function taking the search string and returning a SearchOutcome
+        search_string (str): SKU or product to search
+        attempts (int): Most checks made for the SKU
+        base_delay (float): Backoff cap after the first attempt
+        max_delay (float): Largest backoff cap
+
+    Returns:
+        SearchOutcome: FOUND or NOT_FOUND, or UNKNOWN once the failure is
+            definitive or the attempt budget is spent
+    """
+    metrics = get_metrics()
+    started = time.perf_counter()
+
+    attempt = 1
+    while True:
+        outcome = await check(search_string)
+
+        if outcome.status != UNKNOWN or not outcome.transient:
+            break
+
+        if attempt >= attempts:
+            outcome = outcome._replace(reason=f"{outcome.reason} (after {attempt} attempts)")
+            break
+
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        print(f"Retrying {search_string} in {delay:.1f}s: {outcome.reason}")
+        metrics.inc('retries_total')
+        await asyncio.sleep(delay)
+        attempt += 1
+
+    metrics.observe('check', time.perf_counter() - started)
+    metrics.inc('checks_total', status=outcome.status)
+
+    return outcome
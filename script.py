@@ -1,6 +1,12 @@
+import argparse
+import functools
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from paddy_search import SearchOutcome, unknown, http_error, status_flag, FOUND, NOT_FOUND, UNKNOWN
+from http_session import throttled_get, classify_response, configure_session
+from sku_source import RowSource
+from retry import with_retries
+from pipeline import Pipeline, parse_search_page, DEFAULT_FETCH_WORKERS, DEFAULT_PARSE_WORKERS
 
 # Path to your Excel file
 EXCEL_FILE = "products.xlsx"
@@ -14,61 +20,101 @@ SEARCH_URL_TEMPLATE = "https://www.paddypallin.com.au/nsearch?q={sku}"
 # File to save missing SKUs
 MISSING_PRODUCTS_FILE = "missing_products.xlsx"
 
-def check_product_exists(sku):
+# File to save SKUs that couldn't be checked, with the reason
+UNCHECKED_PRODUCTS_FILE = "unchecked_products.xlsx"
+
+def check_product(sku):
     """
-    Check if a product exists on the website by searching with the SKU.
-    Returns True if the product is found, False otherwise.
+    Search the website for the SKU once.
+    Returns a SearchOutcome: FOUND, NOT_FOUND, or UNKNOWN with the reason if the request failed.
     """
     # Generate the search URL for this SKU
     search_url = SEARCH_URL_TEMPLATE.format(sku=sku)
     try:
-        response = requests.get(search_url, timeout=10)
-        response.raise_for_status()  # Raise error for bad status codes
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Logic to determine if the product exists
-        # Example: Look for specific elements on the search result page
-        if soup.find("div", class_="no-results"):  # Replace with the actual "no results" element class
-            return False
-        return True
+        # Stream the page (paced by the rate limiter) and close the connection once it is classified
+        with throttled_get(search_url, timeout=10, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Error fetching URL for SKU {sku}: HTTP {response.status_code}")
+                return http_error(response.status_code)
+
+            # The product exists unless the no results message comes first
+            status = classify_response(response, sku)
+        return SearchOutcome(NOT_FOUND if status == NOT_FOUND else FOUND)
     except requests.RequestException as e:
         print(f"Error fetching URL for SKU {sku}: {e}")
-        return False
+        return unknown(str(e))
 
-def main():
-    # Read the Excel file
-    try:
-        df = pd.read_excel(EXCEL_FILE)
+def check_product_exists(sku):
+    """
+    Check if a product exists on the website by searching with the SKU.
+    Timeouts and throttled requests are retried with backoff.
+    Returns True if the product is found, False if not, None if it couldn't be checked.
+    """
+    return status_flag(with_retries(check_product, sku), FOUND)
 
-        # Check if required column exists
-        if SKU_COLUMN not in df.columns:
-            print(f"Error: Excel file must contain a '{SKU_COLUMN}' column.")
-            return
+def main(pipeline=False, fetch_workers=DEFAULT_FETCH_WORKERS, parse_workers=DEFAULT_PARSE_WORKERS):
+    """
+    Check every SKU in the Excel file and save the missing ones.
+    With pipeline=True pages are fetched on fetch_workers threads and parsed in parse_workers processes.
+    """
+    # Stream the Excel file row by row
+    try:
+        source = RowSource(EXCEL_FILE, sku_column=SKU_COLUMN)
 
-        # Prepare a list to track missing SKUs
+        # Prepare lists to track missing SKUs and SKUs that couldn't be checked
         missing_skus = []
+        unchecked_skus = []
 
-        # Loop through each SKU
-        for index, row in df.iterrows():
-            sku = row[SKU_COLUMN]
-            print(f"Checking SKU: {sku}")
-
-            if not check_product_exists(sku):
+        def on_result(sku, outcome):
+            if outcome.status == NOT_FOUND:
                 print(f"Product not found for SKU: {sku}")
                 missing_skus.append({"SKU": sku})
+            elif outcome.status == UNKNOWN:
+                print(f"Could not check SKU {sku}: {outcome.reason}")
+                unchecked_skus.append({"SKU": sku, "Error": outcome.reason})
+
+        if pipeline:
+            configure_session(pool_size=fetch_workers)
+
+            # The product exists unless the no results message comes first, same as check_product
+            parse = functools.partial(parse_search_page, inconclusive=FOUND)
+            Pipeline(on_result, parse=parse, fetch_workers=fetch_workers, parse_workers=parse_workers).run(source.unique_skus())
+        else:
+            # Loop through each distinct SKU
+            for sku in source.unique_skus():
+                print(f"Checking SKU: {sku}")
+
+                # Retry timeouts and throttled requests before giving up on the SKU
+                on_result(sku, with_retries(check_product, sku))
 
         # Save missing SKUs to a new Excel file
         if missing_skus:
             missing_df = pd.DataFrame(missing_skus)
             missing_df.to_excel(MISSING_PRODUCTS_FILE, index=False)
             print(f"Missing products saved to {MISSING_PRODUCTS_FILE}")
-        else:
+        elif not unchecked_skus:
             print("All products are present.")
 
+        # Save the SKUs that still failed after retrying, so only those need another run
+        if unchecked_skus:
+            unchecked_df = pd.DataFrame(unchecked_skus)
+            unchecked_df.to_excel(UNCHECKED_PRODUCTS_FILE, index=False)
+            print(f"{len(unchecked_skus)} SKUs could not be checked, saved to {UNCHECKED_PRODUCTS_FILE}")
+
     except FileNotFoundError:
         print(f"Error: File {EXCEL_FILE} not found.")
+    except ValueError as e:
+        # Required column is missing
+        print(f"Error: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Find SKUs that are missing from Paddy Pallin")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Fetch pages on a pool of threads and parse them in a pool of processes")
+    parser.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS, help="Threads fetching pages with --pipeline")
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS, help="Processes parsing pages with --pipeline")
+    args = parser.parse_args()
+
+    main(pipeline=args.pipeline, fetch_workers=args.fetch_workers, parse_workers=args.parse_workers)
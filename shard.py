@@ -0,0 +1,143 @@
+import argparse
+import glob
+import os
+import re
+import zlib
+from paddy_search import normalize_sku
+from sku_source import RowSource
+from result_sink import write_fanned_out
+
+def parse_shard(value):
+    """
+    Parse a --shard argument.
+
+    Args:
+        value (str): Shard as "i/N", e.g. "2/4" for the second of four shards
+
+    Returns:
+        tuple: (shard number from 1 to N, number of shards)
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Shard must look like i/N, got '{value}'")
+
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Shard number must be between 1 and {count}, got {index}")
+
+    return index, count
+
+def shard_of(sku, count):
+    """
+    Get the shard a SKU belongs to.
+
+    Uses a CRC32 of the normalized SKU rather than hash(), which changes
+    between processes, so every process and machine agrees on the split.
+
+    Args:
+        sku (str): Normalized SKU
+        count (int): Number of shards
+
+    Returns:
+        int: Shard number from 1 to count
+    """
+    return zlib.crc32(sku.encode('utf-8')) % count + 1
+
+def in_shard(sku, shard):
+    """
+    Check if a SKU is part of a shard.
+
+    Args:
+        sku (str): Normalized SKU
+        shard (tuple): (shard number, number of shards), or None for the whole file
+
+    Returns:
+        bool: True if the SKU should be checked by this shard
+    """
+    if shard is None:
+        return True
+
+    index, count = shard
+    return shard_of(sku, count) == index
+
+def shard_path(output_file, shard):
+    """
+    Get the partial result file a shard writes instead of the full output file.
+
+    Args:
+        output_file (str): Path to the merged output file
+        shard (tuple): (shard number, number of shards)
+
+    Returns:
+        str: e.g. results.shard-2-of-4.xlsx for results.xlsx
+    """
+    base, ext = os.path.splitext(output_file)
+    index, count = shard
+    return f"{base}.shard-{index}-of-{count}{ext}"
+
+def find_partials(output_file):
+    """
+    Find the partial result files written for an output file, checking none are missing.
+
+    Args:
+        output_file (str): Path to the merged output file
+
+    Returns:
+        list: Paths to the partial result files, in shard order
+    """
+    base, ext = os.path.splitext(output_file)
+    pattern = re.compile(re.escape(base) + r'\.shard-(\d+)-of-(\d+)' + re.escape(ext) + '$')
+
+    shards = {}
+    for path in glob.glob(f"{glob.escape(base)}.shard-*-of-*{glob.escape(ext)}"):
+        match = pattern.match(path)
+        if match:
+            shards[int(match.group(1)), int(match.group(2))] = path
+
+    if not shards:
+        raise ValueError(f"No partial result files found for {output_file}")
+
+    counts = {count for _, count in shards}
+    if len(counts) > 1:
+        raise ValueError(f"Partial result files from runs with different shard counts: {sorted(counts)}")
+
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if (index, count) not in shards]
+    if missing:
+        raise ValueError(f"Missing partial results for shards {missing} of {count}")
+
+    return [shards[index, count] for index in range(1, count + 1)]
+
+def merge_shards(input_file, output_file, columns, sku_column, partial_files=None):
+    """
+    Combine the partial result files of a sharded run into the usual output file.
+
+    The output is written in input order, whatever order the shards finished
+    in, so merging the same partials always gives the same file.
+
+    Args:
+        input_file (str): Path to the input file the shards were run on
+        output_file (str): Path to the merged output file
+        columns (list): Column names, in output order
+        sku_column (str): Column holding the SKU in the partials and the output
+        partial_files (list): Partial result files, found next to the output file if not given
+
+    Returns:
+        int: Number of rows written
+    """
+    if not partial_files:
+        partial_files = find_partials(output_file)
+
+    # Each partial holds one row per SKU its shard checked
+    results = {}
+    for path in partial_files:
+        for _, row in RowSource(path, sku_column=sku_column):
+            results[normalize_sku(row[sku_column])] = {column: row.get(column) for column in columns}
+
+        print(f"Read {path}")
+
+    count = write_fanned_out(output_file, RowSource(input_file), results, columns, sku_column)
+
+    print(f"Merged {len(partial_files)} partial result files ({len(results)} SKUs) into {output_file}")
+
+    return count
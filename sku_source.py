@@ -0,0 +1,133 @@
+import csv
+import os
+from paddy_search import normalize_sku
+
+# Column holding the SKU in the product sheets
+SKU_COLUMN = 'Item Code'
+
+class RowSource:
+    """
+    Streams rows from an xlsx, CSV or Parquet file without loading the whole file.
+
+    Rows are yielded as soon as they are read, as (index, row) pairs where
+    index counts data rows from 0 and row maps column names to values.
+    Fully empty rows are skipped.
+    """
+
+    def __init__(self, path, sku_column=SKU_COLUMN):
+        """
+        Open the input file.
+
+        Args:
+            path (str): Path to an .xlsx, .csv or .parquet file
+            sku_column (str): Column that must be present in the file
+        """
+        self.path = path
+        self.sku_column = sku_column
+        self.format = os.path.splitext(path)[1].lower().lstrip('.')
+
+        if self.format not in ('xlsx', 'xlsm', 'csv', 'parquet'):
+            raise ValueError(f"Unsupported input file type: {path}")
+
+        # Number of data rows, if the format says so without reading the file (otherwise None)
+        self.total = self._count_rows()
+
+        # Column names, known once iteration has read the header
+        self.columns = None
+
+    def _count_rows(self):
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(self.path).metadata.num_rows
+
+        if self.format in ('xlsx', 'xlsm'):
+            from openpyxl import load_workbook
+            workbook = load_workbook(self.path, read_only=True)
+            try:
+                # Taken from the sheet's dimension record, minus the header row
+                max_row = workbook.active.max_row
+                return max_row - 1 if max_row else None
+            finally:
+                workbook.close()
+
+        return None
+
+    def _iter_records(self):
+        if self.format == 'csv':
+            with open(self.path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                self._set_columns(reader.fieldnames or [])
+                yield from reader
+
+        elif self.format == 'parquet':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(self.path)
+            self._set_columns(parquet_file.schema_arrow.names)
+            for batch in parquet_file.iter_batches():
+                yield from batch.to_pylist()
+
+        else:
+            from openpyxl import load_workbook
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, ())
+
+                # Name blank header cells the same way pandas does
+                columns = [
+                    name if name is not None else f"Unnamed: {i}"
+                    for i, name in enumerate(header)
+                ]
+                self._set_columns(columns)
+
+                for values in rows:
+                    yield dict(zip(columns, values))
+            finally:
+                workbook.close()
+
+    def _set_columns(self, columns):
+        self.columns = list(columns)
+        if self.sku_column not in columns:
+            raise ValueError(f"Input file must have a column named '{self.sku_column}'.")
+
+        # Rows are dicts keyed by column name, a repeated name would hide one of its columns
+        duplicates = sorted({str(name) for name in columns if columns.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Input file has more than one column named {', '.join(duplicates)}.")
+
+    def __iter__(self):
+        index = 0
+        for row in self._iter_records():
+            if all(value is None or value == '' for value in row.values()):
+                continue
+
+            yield index, row
+            index += 1
+
+    def skus(self):
+        """
+        Stream the SKU column only.
+
+        Yields:
+            tuple: (index, normalized SKU, None for a blank cell)
+        """
+        for index, row in self:
+            yield index, normalize_sku(row[self.sku_column])
+
+    def unique_skus(self, skip=()):
+        """
+        Stream each distinct normalized SKU once, in order of first appearance.
+
+        Args:
+            skip (set): SKUs to leave out, e.g. those already checked
+
+        Yields:
+            str: Normalized SKU
+        """
+        seen = set()
+        for _, sku in self.skus():
+            if sku is None or sku in seen or sku in skip:
+                continue
+
+            seen.add(sku)
+            yield sku
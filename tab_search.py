@@ -0,0 +1,174 @@
+import heapq
+import time
+from selenium.common.exceptions import JavascriptException, WebDriverException
+from browser import start_navigation, read_new_page_state, archive_page_source
+from paddy_search import build_search_url, unknown, UNKNOWN
+from rate_limit import get_limiter
+from retry import backoff_delay, DEFAULT_ATTEMPTS, DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY
+from metrics import get_metrics
+
+# Searches run at once in each browser
+DEFAULT_TABS = 8
+
+class TabSearcher:
+    """
+    Runs many searches at once in the tabs of one browser.
+
+    Each tab is sent to a search page without waiting for it to load, then
+    every busy tab is polled in turn with one script reading all its page
+    markers. A tab is given its next SKU as soon as its page settles or
+    times out, so one Chrome process keeps `tabs` searches in flight
+    instead of one.
+    """
+
+    def __init__(self, driver, tabs=DEFAULT_TABS, timeout=10, poll_frequency=0.1,
+                 attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Args:
+            driver (webdriver.Chrome): Selenium WebDriver, used by this searcher alone
+            tabs (int): Searches run at once
+            timeout (float): Seconds a search page gets to settle
+            poll_frequency (float): Seconds between two rounds of polling the tabs
+            attempts (int): Most searches per SKU
+            base_delay (float): Backoff cap after the first failed search
+            max_delay (float): Largest backoff cap
+        """
+        self.driver = driver
+        self.tabs = tabs
+        self.timeout = timeout
+        self.poll_frequency = poll_frequency
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _open_tabs(self):
+        handles = [self.driver.current_window_handle]
+        for _ in range(self.tabs - 1):
+            self.driver.switch_to.new_window('tab')
+            handles.append(self.driver.current_window_handle)
+
+        return handles
+
+    def _close_tabs(self, handles):
+        # Leave the browser with the one tab it started with, for whoever uses it next
+        try:
+            for handle in handles[1:]:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(handles[0])
+        except WebDriverException:
+            # The browser is gone, the pool replaces it
+            pass
+
+    def search_all(self, skus, is_settled, classify, on_result):
+        """
+        Search for every SKU, calling on_result as each one finishes.
+
+        Transient failures are searched again after a jittered backoff, in
+        whichever tab is free by then.
+
+        Args:
+            skus (iterable): SKUs to search, read as tabs free up
+            is_settled (callable): Takes a PageState, True once it is decisive
+            classify (callable): Takes the last PageState (None if none could
+                be read) and returns a SearchOutcome
+            on_result (callable): Called with (sku, SearchOutcome) for each SKU
+
+        Raises:
+            WebDriverException: If the browser stops responding; the SKUs it
+                was searching are reported as UNKNOWN first
+        """
+        metrics = get_metrics()
+        pending = iter(skus)
+        exhausted = False
+
+        # (ready at, SKU, attempt, check started) for SKUs waiting out their backoff
+        retries = []
+
+        # Tab handle -> (SKU, URL, attempt, check started, navigation started)
+        busy = {}
+
+        handles = self._open_tabs()
+        idle = list(handles)
+
+        try:
+            while True:
+                # Give every free tab its next search
+                while idle:
+                    if retries and retries[0][0] <= time.monotonic():
+                        _, sku, attempt, check_started = heapq.heappop(retries)
+                    elif not exhausted:
+                        sku = next(pending, None)
+                        if sku is None:
+                            exhausted = True
+                            continue
+                        attempt, check_started = 1, time.perf_counter()
+                    else:
+                        break
+
+                    handle = idle.pop()
+                    url = build_search_url(sku)
+                    get_limiter(url).acquire()
+
+                    self.driver.switch_to.window(handle)
+                    start_navigation(self.driver, url)
+                    busy[handle] = (sku, url, attempt, check_started, time.monotonic())
+
+                if not busy:
+                    if exhausted and not retries:
+                        break
+
+                    # Every tab is free, wait for the next backoff to run out
+                    time.sleep(max(0.0, retries[0][0] - time.monotonic()))
+                    continue
+
+                # Poll every busy tab once
+                for handle, (sku, url, attempt, check_started, navigation_started) in list(busy.items()):
+                    self.driver.switch_to.window(handle)
+                    try:
+                        state = read_new_page_state(self.driver)
+                    except JavascriptException:
+                        # The page is still being swapped in, try again on the next round
+                        state = None
+
+                    elapsed = time.monotonic() - navigation_started
+                    if not (state is not None and is_settled(state)) and elapsed < self.timeout:
+                        continue
+
+                    del busy[handle]
+                    idle.append(handle)
+
+                    get_limiter(url).on_success(elapsed)
+                    metrics.observe('dom_wait', elapsed)
+
+                    # Keep the rendered page for re-classifying later, if archiving is on
+                    archive_page_source(self.driver, sku, url)
+
+                    outcome = classify(state)
+
+                    if outcome.status == UNKNOWN and outcome.transient:
+                        if attempt < self.attempts:
+                            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                            print(f"Retrying {sku} in {delay:.1f}s: {outcome.reason}")
+                            metrics.inc('retries_total')
+                            heapq.heappush(retries, (time.monotonic() + delay, sku, attempt + 1, check_started))
+                            continue
+
+                        outcome = outcome._replace(reason=f"{outcome.reason} (after {attempt} attempts)")
+
+                    metrics.observe('check', time.perf_counter() - check_started)
+                    metrics.inc('checks_total', status=outcome.status)
+                    on_result(sku, outcome)
+
+                time.sleep(self.poll_frequency)
+
+        except WebDriverException as e:
+            # Hand back every SKU this browser still held, so none go missing
+            print(f"Browser stopped responding with {len(busy) + len(retries)} searches in flight: {e}")
+            metrics.inc('errors_total', error=type(e).__name__)
+            for sku, *_ in list(busy.values()) + [(sku,) for _, sku, _, _ in retries]:
+                on_result(sku, unknown(f"Browser stopped responding: {e}"))
+            raise
+
+        finally:
+            self._close_tabs(handles)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The checkers are flat top-level modules, make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+from checkpoint import Checkpoint, checkpoint_path
+
+def test_checkpoint_path():
+    assert checkpoint_path('out.xlsx') == 'out.xlsx.checkpoint.jsonl'
+
+def test_resume_keeps_finished_results(tmp_path):
+    path = str(tmp_path / 'run.checkpoint.jsonl')
+
+    checkpoint = Checkpoint(path, batch_size=2)
+    checkpoint.add('A1', {'SKU': 'A1', 'Found': True})
+    checkpoint.add('B2', {'SKU': 'B2', 'Found': False})
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, resume=True)
+    assert checkpoint.done == {'A1', 'B2'}
+
+    checkpoint.add('C3', {'SKU': 'C3', 'Found': True})
+    assert [key for key, _ in checkpoint.items()] == ['A1', 'B2', 'C3']
+    checkpoint.close()
+
+def test_resume_drops_line_cut_short(tmp_path):
+    path = tmp_path / 'run.checkpoint.jsonl'
+
+    checkpoint = Checkpoint(str(path))
+    checkpoint.add('A1', {'SKU': 'A1'})
+    checkpoint.close()
+
+    # A crash mid-write leaves half a line at the end
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "B2", "rec')
+
+    checkpoint = Checkpoint(str(path), resume=True)
+    assert checkpoint.done == {'A1'}
+
+    checkpoint.add('B2', {'SKU': 'B2'})
+    assert list(checkpoint.records()) == [{'SKU': 'A1'}, {'SKU': 'B2'}]
+    checkpoint.close()
+
+def test_without_resume_starts_over(tmp_path):
+    path = str(tmp_path / 'run.checkpoint.jsonl')
+
+    checkpoint = Checkpoint(path)
+    checkpoint.add('A1', {'SKU': 'A1'})
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.done == set()
+    assert list(checkpoint.items()) == []
+    checkpoint.close()
+
+def test_buffered_results_are_written_on_close(tmp_path):
+    path = str(tmp_path / 'run.checkpoint.jsonl')
+
+    checkpoint = Checkpoint(path, batch_size=100)
+    checkpoint.add('A1', {'SKU': 'A1'})
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, resume=True)
+    assert checkpoint.done == {'A1'}
+    checkpoint.close()
@@ -0,0 +1,117 @@
+import pytest
+from paddy_search import (
+    SearchPageScanner, classify_chunks, classify_search_page, normalize_sku, build_search_url,
+    http_error, status_flag, SearchOutcome, FOUND, NOT_FOUND, UNKNOWN,
+)
+
+FOUND_PAGE = (
+    '<html><body><div class="page-title-wrapper"></div>'
+    '<div id="amasty-shopby-product-list"><ol>'
+    '<li class="item product product-item">Tent</li>'
+    '<li class="item product product-item">Stove</li>'
+    '</ol></div></body></html>'
+)
+
+NOT_FOUND_PAGE = (
+    '<html><body><div class="nxt-nrf-container"><div id="nxt-nrf">'
+    ' Your search - <strong>50931406740S</strong> - did not match any products'
+    '</div></div></body></html>'
+)
+
+# The no results container is always in the page, hidden, ahead of the product list
+HIDDEN_NO_RESULTS_PAGE = (
+    '<html><body><div class="nxt-nrf-container" style="display: none"></div>'
+    '<div id="amasty-shopby-product-list"><ol>'
+    '<li class="item product product-item">Tent</li>'
+    '</ol></div></body></html>'
+)
+
+INCONCLUSIVE_PAGE = '<html><body><div class="page-title-wrapper"></div><div id="challenge"></div></body></html>'
+
+def chunked(text, size):
+    data = text.encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize('page, status', [
+    (FOUND_PAGE, FOUND),
+    (NOT_FOUND_PAGE, NOT_FOUND),
+    (HIDDEN_NO_RESULTS_PAGE, FOUND),
+    (INCONCLUSIVE_PAGE, None),
+    ('', None),
+])
+def test_classify_chunks_whole_page(page, status):
+    assert classify_chunks([page]) == status
+
+@pytest.mark.parametrize('page, status', [
+    (FOUND_PAGE, FOUND),
+    (NOT_FOUND_PAGE, NOT_FOUND),
+    (HIDDEN_NO_RESULTS_PAGE, FOUND),
+    (INCONCLUSIVE_PAGE, None),
+])
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 16, 64])
+def test_classify_chunks_with_markers_split_across_chunks(page, status, size):
+    assert classify_chunks(chunked(page, size)) == status
+
+def test_marker_split_at_every_offset():
+    page = NOT_FOUND_PAGE.encode()
+    start = page.index(b'did not match')
+
+    # Break the page at every byte of the no results text
+    for split in range(start, start + len('did not match any products') + 1):
+        assert classify_chunks([page[:split], page[split:]]) == NOT_FOUND
+
+def test_marker_counted_once_across_chunks():
+    # A product-item before the list opens doesn't count, even when the chunks overlap it
+    scanner = SearchPageScanner()
+    assert scanner.feed(b'<li class="product-item"></li>') is None
+    assert scanner.feed(b'<div id="amasty-shopby-product-list">') is None
+    assert scanner.feed(b'<ol></ol>') is None
+    assert scanner.feed(b'<li class="product-item">') == FOUND
+
+def test_scanner_stops_at_first_decision():
+    scanner = SearchPageScanner()
+    assert scanner.feed(FOUND_PAGE) == FOUND
+
+    # Later chunks are ignored once decided
+    assert scanner.feed(NOT_FOUND_PAGE) == FOUND
+
+def test_scanner_accepts_str_and_bytes():
+    scanner = SearchPageScanner()
+    assert scanner.feed('<div class="nxt-nrf-container">') is None
+    assert scanner.feed(b'did not match any products') == NOT_FOUND
+
+@pytest.mark.parametrize('page, expected', [
+    (FOUND_PAGE, (FOUND, 2)),
+    (NOT_FOUND_PAGE, (NOT_FOUND, 0)),
+    (HIDDEN_NO_RESULTS_PAGE, (FOUND, 1)),
+    (INCONCLUSIVE_PAGE, (None, 0)),
+])
+def test_classify_search_page(page, expected):
+    pytest.importorskip('bs4')
+    assert classify_search_page(page) == expected
+
+@pytest.mark.parametrize('sku, normalized', [
+    ('50931406740S', '50931406740S'),
+    (' a1 ', 'A1'),
+    (50931406.0, '50931406'),
+    ('50931406.0', '50931406'),
+    (50931406, '50931406'),
+    (None, None),
+    ('', None),
+])
+def test_normalize_sku(sku, normalized):
+    assert normalize_sku(sku) == normalized
+
+def test_build_search_url_encodes_the_query():
+    assert build_search_url('A B/1') == 'https://www.paddypallin.com.au/nsearch?q=A%20B/1'
+
+def test_http_error_is_transient_only_for_retryable_codes():
+    assert http_error(503).transient
+    assert http_error(429).transient
+    assert not http_error(404).transient
+    assert http_error(404).status == UNKNOWN
+
+def test_status_flag():
+    assert status_flag(SearchOutcome(FOUND), FOUND) is True
+    assert status_flag(SearchOutcome(NOT_FOUND), FOUND) is False
+    assert status_flag(http_error(503), FOUND) is None
@@ -0,0 +1,148 @@
+import asyncio
+import email.utils
+import pytest
+import rate_limit
+from rate_limit import AdaptiveRateLimiter, parse_retry_after, is_timeout, get_limiter, configure_limiter
+
+class FakeClock:
+    """
+    Stands in for the time module, sleeping only moves the clock forward.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    return clock
+
+def test_requests_are_spaced_at_the_rate(clock):
+    limiter = AdaptiveRateLimiter(rate=2.0)
+
+    started = clock.now
+    for _ in range(5):
+        limiter.acquire()
+
+    # A one-token burst, then one request every half second
+    assert clock.now - started == pytest.approx(2.0)
+
+def test_healthy_responses_ramp_up_to_the_maximum(clock):
+    limiter = AdaptiveRateLimiter(rate=1.0, max_rate=1.2, increase=0.1)
+
+    limiter.on_success(0.1)
+    assert limiter.rate == pytest.approx(1.1)
+
+    for _ in range(10):
+        limiter.on_success(0.1)
+    assert limiter.rate == pytest.approx(1.2)
+
+def test_slow_responses_ease_off(clock):
+    limiter = AdaptiveRateLimiter(rate=1.0, slow_response=3.0)
+
+    limiter.on_success(5.0)
+    assert limiter.rate == pytest.approx(0.9)
+
+def test_throttling_backs_off_to_the_minimum(clock):
+    limiter = AdaptiveRateLimiter(rate=1.0, min_rate=0.3, decrease=0.5)
+
+    limiter.on_throttle()
+    assert limiter.rate == pytest.approx(0.5)
+
+    limiter.on_throttle()
+    assert limiter.rate == pytest.approx(0.3)
+
+def test_retry_after_pauses_every_request(clock):
+    limiter = AdaptiveRateLimiter(rate=10.0)
+
+    started = clock.now
+    limiter.on_response(429, '30')
+    limiter.acquire()
+
+    assert clock.now - started >= 30.0
+
+def test_responses_by_status(clock):
+    limiter = AdaptiveRateLimiter(rate=1.0, increase=0.1, decrease=0.5)
+
+    limiter.on_response(200, latency=0.1)
+    assert limiter.rate == pytest.approx(1.1)
+
+    # Not found is a healthy answer, a server error says nothing either way
+    limiter.on_response(404, latency=0.1)
+    assert limiter.rate == pytest.approx(1.2)
+    limiter.on_response(500, latency=0.1)
+    assert limiter.rate == pytest.approx(1.2)
+
+    limiter.on_response(503)
+    assert limiter.rate == pytest.approx(0.6)
+
+def test_throttled_block(clock):
+    limiter = AdaptiveRateLimiter(rate=1.0, increase=0.1, decrease=0.5)
+
+    with limiter.throttled():
+        clock.sleep(0.5)
+    assert limiter.rate == pytest.approx(1.1)
+
+    with pytest.raises(TimeoutError):
+        with limiter.throttled():
+            raise TimeoutError()
+    assert limiter.rate == pytest.approx(0.55)
+
+    # Errors other than timeouts leave the rate alone
+    with pytest.raises(ValueError):
+        with limiter.throttled():
+            raise ValueError()
+    assert limiter.rate == pytest.approx(0.55)
+
+def test_acquire_async(monkeypatch, clock):
+    async def sleep(seconds):
+        clock.sleep(seconds)
+
+    monkeypatch.setattr(rate_limit.asyncio, 'sleep', sleep)
+    limiter = AdaptiveRateLimiter(rate=4.0)
+
+    async def run():
+        for _ in range(5):
+            await limiter.acquire_async()
+
+    started = clock.now
+    asyncio.run(run())
+    assert clock.now - started == pytest.approx(1.0)
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+    in_a_minute = email.utils.formatdate(rate_limit.time.time() + 60, usegmt=True)
+    assert 55 <= parse_retry_after(in_a_minute) <= 60
+
+def test_is_timeout():
+    class ReadTimeout(Exception):
+        pass
+
+    assert is_timeout(TimeoutError())
+    assert is_timeout(asyncio.TimeoutError())
+    assert is_timeout(ReadTimeout())
+    assert not is_timeout(ValueError())
+
+def test_limiters_are_shared_per_host():
+    assert get_limiter('https://example.com/a') is get_limiter('https://example.com/b?q=1')
+    assert get_limiter('https://example.com/a') is not get_limiter('https://example.org/a')
+
+    limiter = configure_limiter('https://example.net', rate=5.0)
+    assert get_limiter('https://example.net/search') is limiter
+    assert limiter.rate == 5.0
@@ -0,0 +1,128 @@
+import csv
+import pytest
+from result_sink import ResultSink, write_results, write_joined
+from sku_source import RowSource
+
+COLUMNS = ['SKU', 'Found', 'Products', 'Error']
+
+ROWS = [
+    {'SKU': 'A1', 'Found': True, 'Products': 3},
+    {'SKU': 'B2', 'Found': False, 'Products': 0},
+    {'SKU': 'C3', 'Error': 'HTTP 503'},
+]
+
+def read_back(path):
+    # Rows of an output file as lists of values, header first
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            return [row for row in csv.reader(f)]
+
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        return [table.column_names] + [list(row.values()) for row in table.to_pylist()]
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = [list(row) for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+    # Read-only sheets trim blank cells off the end of a row
+    return [row + [None] * (len(rows[0]) - len(row)) for row in rows]
+
+def test_csv_round_trip(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    assert write_results(path, ROWS, COLUMNS) == 3
+
+    assert read_back(path) == [
+        COLUMNS,
+        ['A1', 'True', '3', ''],
+        ['B2', 'False', '0', ''],
+        ['C3', '', '', 'HTTP 503'],
+    ]
+
+def test_xlsx_round_trip(tmp_path):
+    pytest.importorskip('openpyxl')
+    path = str(tmp_path / 'out.xlsx')
+    write_results(path, ROWS, COLUMNS)
+
+    assert read_back(path) == [
+        COLUMNS,
+        ['A1', True, 3, None],
+        ['B2', False, 0, None],
+        ['C3', None, None, 'HTTP 503'],
+    ]
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'out.parquet')
+    write_results(path, ROWS, COLUMNS)
+
+    assert read_back(path) == [
+        COLUMNS,
+        ['A1', True, 3, None],
+        ['B2', False, 0, None],
+        ['C3', None, None, 'HTTP 503'],
+    ]
+
+def test_parquet_without_rows_keeps_columns(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'out.parquet')
+    write_results(path, [], COLUMNS)
+
+    assert read_back(path) == [COLUMNS]
+
+def test_parquet_widens_column_a_later_batch_does_not_fit(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'out.parquet')
+
+    sink = ResultSink(path, ['Item Code', 'Price'], batch_size=2)
+    sink.write_values([50931406, 10])
+    sink.write_values([50931407, 12])
+    sink.write_values(['50931406740S', 9.5])
+    sink.close()
+
+    assert read_back(path) == [
+        ['Item Code', 'Price'],
+        ['50931406', '10'],
+        ['50931407', '12'],
+        ['50931406740S', '9.5'],
+    ]
+
+def test_unsupported_extension():
+    with pytest.raises(ValueError):
+        ResultSink('out.txt', COLUMNS)
+
+def test_write_joined_passes_input_columns_through_as_text(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    input_path = str(tmp_path / 'in.parquet')
+    pq.write_table(pa.table({'Item Code': [50931406, 50931407], 'Qty': [1, 2]}), input_path)
+
+    output_path = str(tmp_path / 'out.parquet')
+    results = {'50931406': {'Found': True}}
+    assert write_joined(output_path, RowSource(input_path), results, ['Found']) == 2
+
+    assert read_back(output_path) == [
+        ['Item Code', 'Qty', 'Found'],
+        ['50931406', '1', True],
+        ['50931407', '2', None],
+    ]
+
+def test_write_joined_keeps_ragged_csv_rows_aligned(tmp_path):
+    input_path = tmp_path / 'in.csv'
+    input_path.write_text('Item Code,Name\nA1,Tent,extra cell\nB2\n', encoding='utf-8')
+
+    output_path = str(tmp_path / 'out.csv')
+    results = {'A1': {'Found': True}, 'B2': {'Found': False}}
+    write_joined(output_path, RowSource(str(input_path)), results, ['Found'])
+
+    assert read_back(output_path) == [
+        ['Item Code', 'Name', 'Found'],
+        ['A1', 'Tent', 'True'],
+        ['B2', '', 'False'],
+    ]
@@ -0,0 +1,30 @@
+import pytest
+from sku_source import RowSource
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'in.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+def test_rows_are_streamed_with_blank_rows_skipped(tmp_path):
+    source = RowSource(write_csv(tmp_path, 'Item Code,Name\n50931406.0,Tent\n,\n a1 ,Stove\n'))
+
+    assert list(source) == [(0, {'Item Code': '50931406.0', 'Name': 'Tent'}), (1, {'Item Code': ' a1 ', 'Name': 'Stove'})]
+    assert source.columns == ['Item Code', 'Name']
+
+def test_unique_skus_are_normalized_and_deduplicated(tmp_path):
+    source = RowSource(write_csv(tmp_path, 'Item Code\n50931406.0\n50931406\na1\nB2\n'))
+
+    assert list(source.unique_skus(skip={'B2'})) == ['50931406', 'A1']
+
+def test_missing_sku_column(tmp_path):
+    source = RowSource(write_csv(tmp_path, 'Code,Name\nA1,Tent\n'))
+
+    with pytest.raises(ValueError):
+        list(source)
+
+def test_duplicate_column_names_are_rejected(tmp_path):
+    source = RowSource(write_csv(tmp_path, 'Item Code,Name,Name\nA1,Tent,Stove\n'))
+
+    with pytest.raises(ValueError, match='Name'):
+        list(source)
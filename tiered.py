@@ -0,0 +1,45 @@
+import requests
+from paddy_search import build_search_url, classify_search_page, SearchOutcome, unknown, http_error
+from http_session import throttled_get
+from metrics import get_metrics
+from page_archive import get_archive
+
+def http_classify(search_string, timeout=10):
+    """
+    Try to classify a SKU with a plain HTTP request, without starting a browser.
+
+    Args:
+        search_string (str): SKU or product to search
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        SearchOutcome: FOUND with the number of products listed, NOT_FOUND, or
+            UNKNOWN if the WebDriver path is needed (transient if the request failed)
+    """
+    # Construct the search URL
+    url = build_search_url(search_string)
+
+    try:
+        response = throttled_get(url, timeout=timeout)
+
+        # Keep the page for re-classifying later, if archiving is on
+        archive = get_archive()
+        if archive is not None:
+            archive.put(search_string, response.content, url=url, status_code=response.status_code, engine='http')
+
+        # Anything other than a normal page is left for the browser to decide
+        if response.status_code != 200:
+            return http_error(response.status_code)
+
+        with get_metrics().timer('parse'):
+            status, product_count = classify_search_page(response.text)
+
+        # Neither marker was served in the HTML, retrying the request won't change that
+        if status is None:
+            return unknown("Search page inconclusive without a browser", transient=False)
+
+        return SearchOutcome(status, product_count=product_count)
+
+    except requests.RequestException as e:
+        print(f"Request error for {search_string}, falling back to WebDriver: {e}")
+        return unknown(str(e))